@@ -1,3 +1,5 @@
+import logging
+from logging.handlers import RotatingFileHandler
 import datetime
 import os
 import glob
@@ -25,6 +27,21 @@ from common.system_controller import restart_app, restart_system
 from utils.health_check import get_health_report
 from utils.device_info import get_device_uuid, get_device_name
 
+# --- Logging ---
+# Configure the root logger once; every module logs through logging.getLogger(__name__)
+LOG_DIR = "logs"
+LOG_FILE = os.path.join(LOG_DIR, "camera_app.log")
+os.makedirs(LOG_DIR, exist_ok=True)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+    handlers=[
+        RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3),
+        logging.StreamHandler(),
+    ],
+)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 # --- Configuration ---
@@ -51,7 +68,7 @@ inference_status = {
 }
 
 # --- Application Startup ---
-print("--- Initializing Application ---")
+logger.info("--- Initializing Application ---")
 os.makedirs(OUTPUT_DIR_IMAGES, exist_ok=True)
 os.makedirs(OUTPUT_DIR_VIDEOS, exist_ok=True)
 os.makedirs(OUTPUT_DIR_CALIB_IMAGES, exist_ok=True)
@@ -78,7 +95,7 @@ def run_inference_task(input_video_path, manual_points=None):
         if not os.path.exists(filesystem_path):
              raise FileNotFoundError(f"File not found at {filesystem_path}")
 
-        print(f"Starting TFLite inference thread for: {filesystem_path}")
+        logger.info("Starting TFLite inference thread for: %s", filesystem_path)
         
         # Generate paths upfront
         base_filename = os.path.basename(filesystem_path)
@@ -175,9 +192,9 @@ def run_inference_task(input_video_path, manual_points=None):
                     base_filename
                 )
                 if slowmo_video_path:
-                    print(f"✅ Created slow-motion fallback video: {slowmo_video_path}")
+                    logger.info("✅ Created slow-motion fallback video: %s", slowmo_video_path)
             except Exception as slowmo_error:
-                print(f"❌ Failed to create slow-motion video: {slowmo_error}")
+                logger.exception("❌ Failed to create slow-motion video: %s", slowmo_error)
             
             total_time = time.time() - start_time
             minutes = int(total_time // 60)
@@ -197,8 +214,8 @@ def run_inference_task(input_video_path, manual_points=None):
             }
             return
 
-        print(f"--- TFLite step complete. CSV at: {tflite_csv_path} ---")
-        print(f"--- TFLite runtime: {stage1_time:.2f}s ---")
+        logger.info("--- TFLite step complete. CSV at: %s ---", tflite_csv_path)
+        logger.info("--- TFLite runtime: %.2fs ---", stage1_time)
         
         # Check homography results
         if homog_exception[0]:
@@ -208,7 +225,7 @@ def run_inference_task(input_video_path, manual_points=None):
             homog_result[0], homog_result[1], homog_result[2], homog_result[3], homog_result[4]
         )
         
-        print(f"--- Homography runtime: {stage2_time:.2f}s ---")
+        logger.info("--- Homography runtime: %.2fs ---", stage2_time)
 
         if not success_homog:
             # Create slow-motion video as fallback
@@ -221,9 +238,9 @@ def run_inference_task(input_video_path, manual_points=None):
                     base_filename
                 )
                 if slowmo_video_path:
-                    print(f"✅ Created slow-motion fallback video: {slowmo_video_path}")
+                    logger.info("✅ Created slow-motion fallback video: %s", slowmo_video_path)
             except Exception as slowmo_error:
-                print(f"❌ Failed to create slow-motion video: {slowmo_error}")
+                logger.exception("❌ Failed to create slow-motion video: %s", slowmo_error)
             
             total_time = time.time() - start_time
             minutes = int(total_time // 60)
@@ -244,9 +261,9 @@ def run_inference_task(input_video_path, manual_points=None):
             return
         
         total_time = time.time() - start_time
-        print(f"--- Homography step complete. IN/OUT determined. ---")
-        print(f"--- Homography runtime: {stage2_time:.2f}s ---")
-        print(f"--- Total inference runtime: {total_time:.2f}s ({total_time/60:.2f} minutes) ---")
+        logger.info("--- Homography step complete. IN/OUT determined. ---")
+        logger.info("--- Homography runtime: %.2fs ---", stage2_time)
+        logger.info("--- Total inference runtime: %.2fs (%.2f minutes) ---", total_time, total_time/60)
 
         # --- STAGE 3: Set final status ---
         # Use homography video if available, otherwise fall back to TFLite video
@@ -262,12 +279,12 @@ def run_inference_task(input_video_path, manual_points=None):
             "output_replay_url": final_replay_path, 
             "message": f"Line calling process complete. {runtime_msg}"
         }
-        print(f"Inference thread finished: {inference_status['status']}")
+        logger.info("Inference thread finished: %s", inference_status['status'])
 
     except Exception as e:
         total_time = time.time() - start_time
-        print(f"❌ Inference thread failed with exception: {e}")
-        print(f"--- Failed after {total_time:.2f}s ---")
+        logger.exception("❌ Inference thread failed with exception: %s", e)
+        logger.info("--- Failed after %.2fs ---", total_time)
         
         # Create slow-motion video as fallback (if we have a valid video path)
         slowmo_video_path = None
@@ -281,7 +298,7 @@ def run_inference_task(input_video_path, manual_points=None):
                     base_filename
                 )
                 if slowmo_video_path:
-                    print(f"✅ Created slow-motion fallback video: {slowmo_video_path}")
+                    logger.info("✅ Created slow-motion fallback video: %s", slowmo_video_path)
             else:
                 # Try to use input_video_path directly
                 try:
@@ -294,11 +311,11 @@ def run_inference_task(input_video_path, manual_points=None):
                             base_filename
                         )
                         if slowmo_video_path:
-                            print(f"✅ Created slow-motion fallback video: {slowmo_video_path}")
+                            logger.info("✅ Created slow-motion fallback video: %s", slowmo_video_path)
                 except:
                     pass
         except Exception as slowmo_error:
-            print(f"❌ Failed to create slow-motion video: {slowmo_error}")
+            logger.exception("❌ Failed to create slow-motion video: %s", slowmo_error)
         
         minutes = int(total_time // 60)
         seconds = int(total_time % 60)
@@ -576,7 +593,7 @@ def get_video_frame_route():
         })
 
     except Exception as e:
-        print(f"❌ Error in /get_video_frame: {e}")
+        logger.exception("❌ Error in /get_video_frame: %s", e)
         return jsonify({"success": False, "message": str(e)}), 500
 
 
@@ -596,9 +613,9 @@ def run_inference_route():
         return jsonify({"success": False, "message": "No input_path provided."}), 400
     
     if manual_points:
-        print(f"Received manual points: {manual_points}")
+        logger.info("Received manual points: %s", manual_points)
     else:
-        print("No manual points, running in Auto-mode.")
+        logger.info("No manual points, running in Auto-mode.")
 
     inference_status = {"status": "running", "output_url": None, "output_2d_url": None, "output_2d_zoom_url": None, "output_replay_url": None, "message": "Process starting..."}
     # Pass manual_points to the thread
@@ -684,7 +701,7 @@ def process_highlights_route():
         return jsonify({"success": True, "files": file_urls})
 
     except Exception as e:
-        print(f"Error in highlights route: {e}")
+        logger.exception("Error in highlights route: %s", e)
         return jsonify({"success": False, "message": str(e)}), 500
 
 
@@ -735,7 +752,7 @@ def process_highlights_from_path_route():
         return jsonify({"success": True, "files": file_urls})
 
     except Exception as e:
-        print(f"Error in highlights route: {e}")
+        logger.exception("Error in highlights route: %s", e)
         return jsonify({"success": False, "message": str(e)}), 500
 
 
@@ -811,10 +828,10 @@ def restart_system_route():
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    print("--- Running in development mode ---")
+    logger.info("--- Running in development mode ---")
     try:
         app.run(host="0.0.0.0", port=5000, debug=True, threaded=True, use_reloader=False)
     except KeyboardInterrupt:
-        print("Keyboard interrupt received, cleaning up.")
+        logger.info("Keyboard interrupt received, cleaning up.")
     finally:
         cleanup()
\ No newline at end of file
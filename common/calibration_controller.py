@@ -1,9 +1,12 @@
+import logging
 import cv2
 import numpy as np
 import os
 import glob
 import subprocess
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 CHECKERBOARD_SIZE = (9, 6)
 CALIBRATION_DIR = "static/calibration_images"
@@ -23,7 +26,7 @@ def find_checkerboard_in_image(image_path):
     """
     img = cv2.imread(image_path)
     if img is None:
-        print(f"ERROR: Failed to load image at {image_path}")
+        logger.error("Failed to load image at %s", image_path)
         return False, "Failed to load image.", None
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD_SIZE, None)
@@ -42,7 +45,7 @@ def run_calibration_process():
     """
     Performs fisheye camera calibration using the logic from your calibrate.py.
     """
-    print("\n--- Starting Fisheye Calibration Process ---")
+    logger.info("--- Starting Fisheye Calibration Process ---")
     objpoints = []
     imgpoints = []
     
@@ -52,20 +55,21 @@ def run_calibration_process():
         if os.path.exists(f.replace('_preview.jpg', '.jpg'))
     ]
 
-    print(f"Found {len(original_images_with_previews)} images with successful checkerboard detection.")
+    logger.info("Found %s images with successful checkerboard detection.", len(original_images_with_previews))
 
     if len(original_images_with_previews) < MIN_IMAGES_REQUIRED:
         message = f"Not enough valid images. {MIN_IMAGES_REQUIRED} are required, but only {len(original_images_with_previews)} have a detected checkerboard."
-        print(f"ERROR: {message}")
+        logger.error("%s", message)
         return False, message
 
     for fname in original_images_with_previews:
-        img = cv2.imread(fname)
-        if img is None:
-            print(f"WARN: Could not read image {fname}, skipping.")
+        # Only the grayscale image is needed here: let the JPEG decoder emit
+        # luma directly instead of decoding to BGR and running cvtColor
+        gray = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            logger.warning("Could not read image %s, skipping.", fname)
             continue
             
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD_SIZE, None)
         
         if ret:
@@ -76,14 +80,14 @@ def run_calibration_process():
             )
             imgpoints.append(refined_corners.reshape(1, -1, 2))
         else:
-            print(f"WARN: Could not re-find corners in {fname}, skipping.")
+            logger.warning("Could not re-find corners in %s, skipping.", fname)
 
     if len(objpoints) < MIN_IMAGES_REQUIRED:
         message = f"Could not extract enough valid corner points. Needed {MIN_IMAGES_REQUIRED}, got {len(objpoints)}."
-        print(f"ERROR: {message}")
+        logger.error("%s", message)
         return False, message
 
-    print(f"Proceeding to calibrate with {len(objpoints)} valid images.")
+    logger.info("Proceeding to calibrate with %s valid images.", len(objpoints))
     
     try:
         K = np.zeros((3, 3))
@@ -97,18 +101,18 @@ def run_calibration_process():
             criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-6)
         )
 
-        print("\n🎉 Calibration successful!")
+        logger.info("🎉 Calibration successful!")
         os.makedirs(os.path.dirname(CAMERA_MATRIX_FILE), exist_ok=True)
         np.save(CAMERA_MATRIX_FILE, K)
         np.save(DIST_COEFF_FILE, D)
         
         message = f"✅ Fisheye calibration successful! Saved camera_matrix.npy and dist_coeff.npy"
-        print(message)
+        logger.info("%s", message)
         return True, message
 
     except cv2.error as e:
         message = f"Fisheye calibration failed with an OpenCV error: {e}"
-        print(f"ERROR: {message}")
+        logger.exception("%s", message)
         return False, message
 
 
@@ -190,7 +194,7 @@ def undistort_video(video_path, output_dir="static/uploads"):
     out_raw = cv2.VideoWriter(raw_output_path, fourcc_raw, fps, OUTPUT_DIM)
 
     if not out_raw.isOpened():
-        print("❌ ERROR: Could not initialize the intermediate VideoWriter. Check OpenCV/ffmpeg installation.")
+        logger.error("❌ Could not initialize the intermediate VideoWriter. Check OpenCV/ffmpeg installation.")
         cap.release()
         return False, "Failed to create intermediate video file.", None
 
@@ -209,7 +213,7 @@ def undistort_video(video_path, output_dir="static/uploads"):
     web_output_filename = "web_undistorted_" + os.path.basename(video_path)
     web_output_path = os.path.join(output_dir, web_output_filename)
     
-    print(f"Re-encoding for web playback...")
+    logger.info("Re-encoding for web playback...")
     
     command = [
         'ffmpeg',
@@ -223,16 +227,16 @@ def undistort_video(video_path, output_dir="static/uploads"):
 
     try:
         subprocess.run(command, check=True, capture_output=True, text=True)
-        print("✅ Web encoding successful!")
+        logger.info("✅ Web encoding successful!")
         
         os.remove(raw_output_path)
 
         return True, "Video processed successfully.", os.path.basename(web_output_path)
 
     except subprocess.CalledProcessError as e:
-        print(f"❌ ERROR: ffmpeg re-encoding failed.")
-        print(f"ffmpeg stdout: {e.stdout}")
-        print(f"ffmpeg stderr: {e.stderr}")
+        logger.exception("❌ ffmpeg re-encoding failed.")
+        logger.error("ffmpeg stdout: %s", e.stdout)
+        logger.error("ffmpeg stderr: %s", e.stderr)
         os.remove(raw_output_path)
         return False, "Video conversion for web playback failed.", None
 
@@ -275,5 +279,5 @@ def undistort_image(image_path):
         return True, "Image undistorted successfully.", output_path
 
     except Exception as e:
-        print(f"ERROR in undistort_image: {e}")
+        logger.exception("undistort_image failed: %s", e)
         return False, str(e), None
\ No newline at end of file
@@ -1,3 +1,4 @@
+import logging
 import os
 import threading
 import time
@@ -5,11 +6,15 @@ import subprocess
 from picamera2 import Picamera2
 from picamera2.encoders import H264Encoder
 
+logger = logging.getLogger(__name__)
+
 # --- Camera Configuration ---
 FISHEYE_CAM_ID = 0
 VIDEO_WIDTH = 1920
 VIDEO_HEIGHT = 1080
 VIDEO_FRAMERATE = 47.57
+AE_SETTLE_TIMEOUT = 2.0 # Upper bound (seconds) to wait for auto-exposure to lock
+AE_STATE_CONVERGED = 2 # libcamera controls::AeStateConverged
 
 # --- Global Variables ---
 picam = None
@@ -30,7 +35,10 @@ def get_recording_status():
 def initialize_camera():
     """Initializes and configures the fisheye camera with the desired framerate."""
     global picam
-    print("--- Initializing Fisheye Camera ---")
+    if picam is not None and picam.started:
+        # Already running - keep the long-lived instance instead of re-opening it
+        return True
+    logger.info("--- Initializing Fisheye Camera ---")
     try:
         picam = Picamera2(camera_num=FISHEYE_CAM_ID)
         # Create a configuration with the specified resolution and framerate
@@ -40,14 +48,26 @@ def initialize_camera():
         )
         picam.configure(config)
         picam.start()
-        time.sleep(2.0)
-        print(f"Fisheye camera started successfully at {VIDEO_FRAMERATE} FPS.")
+        _wait_for_ae_lock()
+        logger.info("Fisheye camera started successfully at %s FPS.", VIDEO_FRAMERATE)
         return True
     except Exception as e:
-        print(f"ERROR: Failed to initialize camera: {e}")
+        logger.exception("Failed to initialize camera: %s", e)
         return False
 
 
+def _wait_for_ae_lock():
+    """Blocks until auto-exposure reports locked, or AE_SETTLE_TIMEOUT elapses."""
+    deadline = time.monotonic() + AE_SETTLE_TIMEOUT
+    while time.monotonic() < deadline:
+        # capture_metadata() returns once per frame, so this polls at the sensor rate
+        metadata = picam.capture_metadata()
+        # Older libcamera reports AeLocked; newer builds report AeState instead
+        if metadata.get("AeLocked", False) or metadata.get("AeState") == AE_STATE_CONVERGED:
+            return
+    logger.warning("⚠️ Auto-exposure did not settle within %.1fs, starting anyway.", AE_SETTLE_TIMEOUT)
+
+
 def capture_image(filepath):
     """Captures a single still image and saves it."""
     global picam
@@ -60,10 +80,10 @@ def capture_image(filepath):
         try:
             # Picamera2 handles the color conversion correctly for still captures.
             picam.capture_file(filepath)
-            print(f"Image saved to {filepath}")
+            logger.info("Image saved to %s", filepath)
             return True, "Image captured successfully."
         except Exception as e:
-            print(f"ERROR: Failed to capture image: {e}")
+            logger.exception("Failed to capture image: %s", e)
             return False, f"Failed to capture image: {e}"
 
 
@@ -72,9 +92,9 @@ def _record_video_loop():
     A simple thread target that just waits for the stop signal.
     The actual recording is handled by the Picamera2 encoder in the background.
     """
-    print("Recording thread started. Waiting for stop signal...")
+    logger.info("Recording thread started. Waiting for stop signal...")
     stop_recording_event.wait() # This will block until stop_recording() is called
-    print("Recording thread finished.")
+    logger.info("Recording thread finished.")
 
 
 def start_recording(filepath):
@@ -104,10 +124,10 @@ def start_recording(filepath):
             recording_thread = threading.Thread(target=_record_video_loop, daemon=True)
             recording_thread.start()
             
-            print(f"Started raw recording to {temp_raw_path}")
+            logger.info("Started raw recording to %s", temp_raw_path)
             return True, "Video recording started."
         except Exception as e:
-            print(f"ERROR starting raw recording: {e}")
+            logger.exception("Failed to start raw recording: %s", e)
             return False, f"Failed to start recording: {e}"
 
 
@@ -118,7 +138,7 @@ def stop_recording():
     with lock:
         if not recording_active:
             return False, "No active recording to stop.", None
-        print("Stopping raw recording...")
+        logger.info("Stopping raw recording...")
         
         # Stop the encoder first
         picam.stop_encoder()
@@ -130,13 +150,14 @@ def stop_recording():
     if recording_thread:
         recording_thread.join(timeout=2) # Wait for the thread to finish
 
-    print(f"\nConverting {temp_raw_path} to {output_path}...")
+    logger.info("Converting %s to %s...", temp_raw_path, output_path)
     
     # Construct the ffmpeg command to repackage the raw stream into an MP4
     command = [
         'ffmpeg',
         '-y',                         # Overwrite output file if it exists
         '-framerate', str(VIDEO_FRAMERATE), # Tell ffmpeg the input stream's FPS
+        '-fflags', '+genpts',         # Generate timestamps for the raw stream
         '-i', temp_raw_path,
         '-c:v', 'copy',               # Copy the video stream without re-encoding
         '-r', str(VIDEO_FRAMERATE),   # Explicitly set the output file's FPS metadata
@@ -146,28 +167,28 @@ def stop_recording():
     try:
         # Run the ffmpeg command
         subprocess.run(command, check=True)
-        print("✅ Conversion successful!")
+        logger.info("✅ Conversion successful!")
         
         # --- Clean up the temporary raw file ---
-        print(f"Removing temporary file: {temp_raw_path}")
+        logger.info("Removing temporary file: %s", temp_raw_path)
         os.remove(temp_raw_path)
 
         return True, "Video recording stopped and file converted.", output_path
 
     except FileNotFoundError:
-        print("❌ ERROR: ffmpeg is not installed or not in your PATH.")
+        logger.exception("❌ ffmpeg is not installed or not in your PATH.")
         return False, "ffmpeg not found. Cannot convert video.", None
     except subprocess.CalledProcessError as e:
-        print(f"❌ ERROR: ffmpeg conversion failed with error: {e}")
+        logger.exception("❌ ffmpeg conversion failed: %s", e)
         return False, "Video conversion failed.", None
 
 
 def cleanup():
     """Stops the camera and cleans up resources."""
     global picam
-    print("--- Performing cleanup ---")
+    logger.info("--- Performing cleanup ---")
     if recording_active:
         stop_recording()
     if picam and picam.started:
         picam.stop()
-        print("Camera stopped.")
\ No newline at end of file
+        logger.info("Camera stopped.")
\ No newline at end of file
@@ -1,48 +1,53 @@
+import logging
 import os
 import datetime
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from flask import send_file
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 CAPTURES_DIR = "static/captures"
 RECORDINGS_DIR = "static/recordings"
 ALL_DIRS = [CAPTURES_DIR, RECORDINGS_DIR]
 
+def _scan_directory(directory):
+    """Returns file info dicts for every regular file in a single directory."""
+    files = []
+    if not os.path.isdir(directory):
+        return files
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                files.append({
+                    "name": entry.name,
+                    "path": os.path.join(directory, entry.name),
+                    "size": round(stat.st_size / (1024 * 1024), 2),  # Size in MB
+                    "modified_timestamp": stat.st_mtime,
+                    "modified_date": datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+                })
+            except OSError as e:
+                logger.debug("Could not stat file %s: %s", entry.path, e)
+    return files
+
 def get_file_list():
     """
     Scans the media directories and returns a dictionary of files,
     separated by type (images and videos).
     """
-    file_data = {"images": [], "videos": []}
-    
-    for directory in ALL_DIRS:
-        if not os.path.exists(directory):
-            continue
-        for filename in os.listdir(directory):
-            filepath = os.path.join(directory, filename)
-            if os.path.isfile(filepath):
-                try:
-                    stat = os.stat(filepath)
-                    file_info = {
-                        "name": filename,
-                        "path": filepath,
-                        "size": round(stat.st_size / (1024 * 1024), 2),  # Size in MB
-                        "modified_timestamp": stat.st_mtime,
-                        "modified_date": datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    if directory == CAPTURES_DIR:
-                        file_data["images"].append(file_info)
-                    else:
-                        file_data["videos"].append(file_info)
-
-                except Exception as e:
-                    print(f"WARN: Could not stat file {filepath}: {e}")
+    # Scan the directories concurrently so their stat() calls overlap on the SD card
+    with ThreadPoolExecutor(max_workers=len(ALL_DIRS)) as executor:
+        images, videos = executor.map(_scan_directory, [CAPTURES_DIR, RECORDINGS_DIR])
 
     # Sort files in each category by date, newest first
-    file_data["images"].sort(key=lambda x: x['modified_timestamp'], reverse=True)
-    file_data["videos"].sort(key=lambda x: x['modified_timestamp'], reverse=True)
-    
-    return file_data
+    images.sort(key=lambda x: x['modified_timestamp'], reverse=True)
+    videos.sort(key=lambda x: x['modified_timestamp'], reverse=True)
+
+    return {"images": images, "videos": videos}
 
 def create_zip_archive(files_to_zip, zip_filename="archive.zip"):
     """
@@ -54,7 +59,7 @@ def create_zip_archive(files_to_zip, zip_filename="archive.zip"):
             if os.path.exists(file_path):
                 zipf.write(file_path, os.path.basename(file_path))
             else:
-                print(f"WARN: File not found for zipping: {file_path}")
+                logger.warning("File not found for zipping: %s", file_path)
     return zip_filepath
 
 def delete_selected_files(files_to_delete):
@@ -1,34 +1,13 @@
+import logging
 import cv2
 import numpy as np
 import pandas as pd
 import os
-import subprocess
-from ultralytics import YOLO
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.ffmpeg_pipe import open_h264_pipe, close_h264_pipe
 
-def reencode_for_web(input_path, output_path):
-    """
-    Converts a video to H.264 format using ffmpeg for browser compatibility.
-    """
-    try:
-        if os.path.exists(output_path):
-            os.remove(output_path)
-            
-        command = [
-            'ffmpeg',
-            '-y',                 # Overwrite output
-            '-i', input_path,     # Input file
-            '-vcodec', 'libx264', # Web-compatible video codec
-            '-acodec', 'aac',     # Audio codec (standard)
-            '-pix_fmt', 'yuv420p',# Pixel format for broad compatibility
-            '-movflags', 'faststart', # Optimize for web streaming
-            output_path
-        ]
-        # Run ffmpeg (suppress output to keep logs clean)
-        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return True
-    except Exception as e:
-        print(f"Error re-encoding video {input_path}: {e}")
-        return False
+logger = logging.getLogger(__name__)
 
 def generate_highlights(video_path, csv_path, output_dir):
     """
@@ -42,29 +21,15 @@ def generate_highlights(video_path, csv_path, output_dir):
     # Names
     base_name = os.path.basename(video_path).split('.')[0]
     
-    # Temp paths (OpenCV writes these)
-    temp_highlight = os.path.join(output_dir, f"temp_highlights_{base_name}.mp4")
-    temp_longest = os.path.join(output_dir, f"temp_longest_{base_name}.mp4")
-    temp_shortest = os.path.join(output_dir, f"temp_shortest_{base_name}.mp4")
-
-    # Final Web Paths (FFmpeg writes these)
+    # Final Web Paths (OpenCV frames are piped straight into ffmpeg)
     final_highlight = os.path.join(output_dir, f"highlights_{base_name}.mp4")
     final_longest = os.path.join(output_dir, f"longest_{base_name}.mp4")
     final_shortest = os.path.join(output_dir, f"shortest_{base_name}.mp4")
 
-    # Load Resources
-    device = 'cpu' # Use CPU for Pi
-    print(f"Loading YOLOv8 model on {device}...")
-    try:
-        # Ensure you have the model file, or download yolov8n.pt
-        yolo_model = YOLO("yolov8n.pt").to(device)
-    except:
-        print("Warning: YOLO model not found/loaded. Skipping player speed calculation.")
-
     try:
         df = pd.read_csv(csv_path)
     except Exception as e:
-        print(f"Error reading CSV: {e}")
+        logger.exception("Error reading CSV: %s", e)
         return False, None
 
     # --- Identify Active Sequences ---
@@ -107,98 +72,143 @@ def generate_highlights(video_path, csv_path, output_dir):
         start_frame = seq[0][0]
         end_frame = seq[-1][0]
         
-        # Simple ball speed calc
-        ball_speeds = [np.linalg.norm(np.array(seq[j][1:]) - np.array(seq[j-1][1:])) for j in range(1, len(seq))]
-        avg_ball_speed = np.mean(ball_speeds) if ball_speeds else 0
+        # Simple ball speed calc (stack once, diff consecutive positions)
+        diffs = np.diff(np.asarray(seq, dtype=np.float32)[:, 1:], axis=0)
+        avg_ball_speed = float(np.hypot(diffs[:, 0], diffs[:, 1]).mean()) if len(diffs) else 0.0
         
         # Score = Duration * 0.4 + Speed * 0.3
         score = (len(seq) * 0.4) + (avg_ball_speed * 0.3)
         highlight_scores.append((score, start_frame, end_frame))
 
-    # Select top 25%
+    # Select top 25%, then put them back in playback order so the video
+    # can be written in a single forward pass
     highlight_scores.sort(reverse=True, key=lambda x: x[0])
     selected_sequences = highlight_scores[:max(1, len(highlight_scores) // 4)]
+    selected_sequences.sort(key=lambda x: x[1])
 
-    # --- 1. Write Main Highlights (Temp) ---
-    print("Writing raw highlights...")
-    out = cv2.VideoWriter(temp_highlight, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-    
-    final_clips_meta = [] # Store metadata for finding long/short later
-    
-    for _, start, end in selected_sequences:
-        final_clips_meta.append({'start': start, 'end': end})
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-        for f_idx in range(int(start), int(end) + 1):
-            ret, frame = cap.read()
-            if not ret: break
-            
-            # Draw ball
-            row = df[df["Frame"] == f_idx]
-            if not row.empty and row['Visibility'].values[0] > 0:
-                cv2.circle(frame, (int(row['X'].values[0]), int(row['Y'].values[0])), 7, (0, 0, 255), -1)
-            
-            out.write(frame)
-    out.release()
-
-    # --- 2. Write Individual Clips (Temp) ---
-    temp_files = {"highlights": temp_highlight}
-    
+    # Per-frame (visibility, x, y) lookup, indexed by frame number
+    ball_xy = _build_ball_lookup(df)
+
+    # --- 1. Write Main Highlights ---
+    logger.info("Writing highlights...")
+    stage_start = time.time()
+    try:
+        proc = open_h264_pipe(final_highlight, width, height, fps)
+    except OSError as e:
+        cap.release()
+        logger.exception("❌ Could not start ffmpeg: %s", e)
+        return False, "Could not start ffmpeg."
+
+    # Store metadata for finding long/short later
+    final_clips_meta = [{'start': start, 'end': end} for _, start, end in selected_sequences]
+
+    # Sweep forward instead of seeking: grab() skips the BGR conversion for
+    # frames outside a rally, and no H.264 keyframe re-decode is needed.
+    f_idx = 0
+    video_ended = False
+    try:
+        for _, start, end in selected_sequences:
+            while not video_ended and f_idx < int(start):
+                if not cap.grab():
+                    video_ended = True
+                    break
+                f_idx += 1
+            while not video_ended and f_idx <= int(end):
+                ret, frame = cap.read()
+                if not ret:
+                    video_ended = True
+                    break
+
+                # Draw ball
+                if f_idx < len(ball_xy):
+                    v, x, y = ball_xy[f_idx]
+                    if v > 0:
+                        cv2.circle(frame, (x, y), 7, (0, 0, 255), -1)
+
+                proc.stdin.write(frame.data)
+                f_idx += 1
+    except BrokenPipeError:
+        # ffmpeg exited early; close_h264_pipe() below reports its exit code
+        logger.error("❌ ffmpeg stopped accepting frames for %s", final_highlight)
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        cap.release()
+    final_files = {}
+    if close_h264_pipe(proc, final_highlight):
+        final_files["highlights"] = final_highlight
+
+    # --- 2. Write Individual Clips ---
+    # Each clip has its own capture and ffmpeg pipe, so both are written at once
+    clips = {}
     if final_clips_meta:
         # Longest
         longest = max(final_clips_meta, key=lambda x: x['end'] - x['start'])
-        _write_single_clip(video_path, longest['start'], longest['end'], temp_longest, df)
-        temp_files["longest"] = temp_longest
+        clips["longest"] = (longest, final_longest)
 
         # Shortest
         min_frames = min_shortest_rally_duration_seconds * fps
         eligible = [c for c in final_clips_meta if (c['end'] - c['start']) >= min_frames]
         if eligible:
             shortest = min(eligible, key=lambda x: x['end'] - x['start'])
-            _write_single_clip(video_path, shortest['start'], shortest['end'], temp_shortest, df)
-            temp_files["shortest"] = temp_shortest
+            clips["shortest"] = (shortest, final_shortest)
 
-    cap.release()
+    if clips:
+        with ThreadPoolExecutor(max_workers=len(clips)) as pool:
+            futures = {
+                key: pool.submit(_write_single_clip, video_path, clip['start'], clip['end'], out_path, ball_xy)
+                for key, (clip, out_path) in clips.items()
+            }
+        for key, future in futures.items():
+            if future.result():
+                final_files[key] = clips[key][1]
 
-    # --- 3. Re-encode All for Web ---
-    print("Re-encoding videos for web compatibility...")
-    final_files = {}
-    
-    # Process Highlights
-    if reencode_for_web(temp_highlight, final_highlight):
-        final_files["highlights"] = final_highlight
-        os.remove(temp_highlight) # Clean up raw file
-
-    # Process Longest
-    if "longest" in temp_files and reencode_for_web(temp_longest, final_longest):
-        final_files["longest"] = final_longest
-        os.remove(temp_longest)
-
-    # Process Shortest
-    if "shortest" in temp_files and reencode_for_web(temp_shortest, final_shortest):
-        final_files["shortest"] = final_shortest
-        os.remove(temp_shortest)
+    logger.info("Highlights finished in %.2fs", time.time() - stage_start)
 
     return True, final_files
 
-def _write_single_clip(video_path, start, end, out_path, df):
-    """Helper to write a specific frame range to a file."""
+def _build_ball_lookup(df):
+    """Returns a list indexed by frame number holding [visibility, x, y] as plain ints."""
+    frames = df["Frame"].to_numpy(dtype=np.int64)
+    ball_xy = np.zeros((frames.max() + 1, 3), dtype=np.int32)
+    ball_xy[frames] = df[["Visibility", "X", "Y"]].fillna(0).to_numpy(dtype=np.int32)
+    return ball_xy.tolist()
+
+def _write_single_clip(video_path, start, end, out_path, ball_xy):
+    """Helper to write a specific frame range to a file. Returns True on success."""
     cap = cv2.VideoCapture(video_path)
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-    out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+
+    try:
+        proc = open_h264_pipe(out_path, w, h, fps)
+    except OSError as e:
+        cap.release()
+        logger.exception("❌ Could not start ffmpeg: %s", e)
+        return False
     cap.set(cv2.CAP_PROP_POS_FRAMES, start)
-    
-    for f_idx in range(int(start), int(end) + 1):
-        ret, frame = cap.read()
-        if not ret: break
-        
-        row = df[df["Frame"] == f_idx]
-        if not row.empty and row['Visibility'].values[0] > 0:
-            cv2.circle(frame, (int(row['X'].values[0]), int(row['Y'].values[0])), 7, (0, 0, 255), -1)
-        
-        out.write(frame)
-    
-    cap.release()
-    out.release()
\ No newline at end of file
+
+    try:
+        for f_idx in range(int(start), int(end) + 1):
+            ret, frame = cap.read()
+            if not ret: break
+
+            if f_idx < len(ball_xy):
+                v, x, y = ball_xy[f_idx]
+                if v > 0:
+                    cv2.circle(frame, (x, y), 7, (0, 0, 255), -1)
+
+            proc.stdin.write(frame.data)
+    except BrokenPipeError:
+        # ffmpeg exited early; close_h264_pipe() below reports its exit code
+        logger.error("❌ ffmpeg stopped accepting frames for %s", out_path)
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        cap.release()
+    return close_h264_pipe(proc, out_path)
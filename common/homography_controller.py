@@ -1,14 +1,33 @@
+import logging
 import cv2
 import numpy as np
 import pandas as pd
 import os
 import subprocess
+import queue
+from functools import lru_cache
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import torch
 from ultralytics import YOLO
-from tqdm import tqdm
+from utils.ffmpeg_pipe import FRAGMENTED_MP4_FLAGS, open_h264_pipe, close_h264_pipe
+
+try:
+    import bottleneck as bn # Optional: much faster moving-window means
+except ImportError:
+    bn = None
+
+logger = logging.getLogger(__name__)
 
 # --- CONFIGURATION ---
 MODEL_PATH = "badminton_court_keypoint.pt" 
 CONFIDENCE_THRESHOLD = 0.3
+YOLO_BATCH_SIZE = 8 # Frames per YOLO call during court detection
+YOLO_HALF = torch.cuda.is_available() # FP16 only pays off on a CUDA GPU; the Pi CPU stays FP32
+HIT_COS_THRESHOLD = np.cos(np.radians(30)) # Direction change above 30 deg counts as a hit
+SMOOTH_WINDOW = 7 # Frames in the centered trajectory smoothing window
+YOLO_FRAME_STRIDE = 3 # Run court detection on every Nth frame only
+FRAME_QUEUE_SIZE = YOLO_BATCH_SIZE # Decoded frames buffered ahead of YOLO (~6MB each at 1080p)
 # ----------------------
 
 # --- COURT TEMPLATE (GLOBAL) ---
@@ -35,93 +54,298 @@ TEMPLATE_PTS_HOMOGRAPHY = np.array([
     COURT_TEMPLATE["front_service_line"][1]
 ], dtype=np.float32)
 
+# --- IN/OUT zone (singles) corners, as pairs of intersecting template lines ---
+# Order traces the polygon: baseline-left, baseline-right, net-right, net-left
+ZONE_CORNER_LINES = [
+    ("baseline_bottom", "left_inner_line"),
+    ("baseline_bottom", "right_inner_line"),
+    ("net", "right_inner_line"),
+    ("net", "left_inner_line"),
+]
+
+# --- Template lines as one (K, 2, 2) array, row-aligned with COURT_LINE_NAMES ---
+COURT_LINE_NAMES = list(COURT_TEMPLATE)
+COURT_LINES_XY = np.array([COURT_TEMPLATE[n] for n in COURT_LINE_NAMES], dtype=np.float32)
+COURT_LINE_IDX = {name: i for i, name in enumerate(COURT_LINE_NAMES)}
+ZONE_LINES_A = np.array([COURT_LINE_IDX[a] for a, _ in ZONE_CORNER_LINES])
+ZONE_LINES_B = np.array([COURT_LINE_IDX[b] for _, b in ZONE_CORNER_LINES])
+
 # --- 2D IMAGE CONSTANTS ---
 W_2D = 1665
 H_2D = 3228
 PADDING = 100
 
-# --- Utility: Line Intersection ---
-def line_intersection(p1, p2, p3, p4):
-    """Finds intersection of lines (p1,p2) and (p3,p4). Returns None if parallel."""
-    x1, y1 = p1; x2, y2 = p2
-    x3, y3 = p3; x4, y4 = p4
+# --- Utility: 3x3 Homography Inverse ---
+def invert_homography(H):
+    """Closed-form inverse of a 3x3 matrix via its adjugate (no LAPACK call)."""
+    # Plain Python floats: numpy scalar arithmetic would cost more than LAPACK
+    (a, b, c), (d, e, f), (g, h, i) = np.asarray(H, dtype=np.float64).tolist()
+    A, B, C = e*i - f*h, f*g - d*i, d*h - e*g
+    det = a*A + b*B + c*C
+    if det == 0:
+        raise np.linalg.LinAlgError("Singular homography")
+    r = 1.0 / det
+    return np.array([
+        [A*r, (c*h - b*i)*r, (b*f - c*e)*r],
+        [B*r, (a*i - c*g)*r, (c*d - a*f)*r],
+        [C*r, (b*g - a*h)*r, (a*e - b*d)*r],
+    ])
+
+# --- Utility: Batched Line Intersection ---
+def line_intersections(lines_a, lines_b):
+    """
+    Vectorized line intersection: intersects lines_a[i] with lines_b[i].
+    Both inputs are (N, 2, 2) arrays of endpoint pairs. Returns an (N, 2)
+    float array whose rows are NaN where the two lines are parallel.
+    """
+    a = np.asarray(lines_a, dtype=np.float64)
+    b = np.asarray(lines_b, dtype=np.float64)
+    x1, y1, x2, y2 = a[:, 0, 0], a[:, 0, 1], a[:, 1, 0], a[:, 1, 1]
+    x3, y3, x4, y4 = b[:, 0, 0], b[:, 0, 1], b[:, 1, 0], b[:, 1, 1]
     denom = (x1 - x2)*(y3 - y4) - (y1 - y2)*(x3 - x4)
-    if denom == 0:
-        return None
-    px = ((x1*y2 - y1*x2)*(x3 - x4) - (x1 - x2)*(x3*y4 - y3*x4)) / denom
-    py = ((x1*y2 - y1*x2)*(y3 - y4) - (y1 - y2)*(x3*y4 - y3*x4)) / denom
-    return int(px), int(py)
+    det_a = x1*y2 - y1*x2
+    det_b = x3*y4 - y3*x4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        px = (det_a*(x3 - x4) - (x1 - x2)*det_b) / denom
+        py = (det_a*(y3 - y4) - (y1 - y2)*det_b) / denom
+    pts = np.stack([px, py], axis=1)
+    pts[denom == 0] = np.nan
+    return pts
+
+# --- Global Variables ---
+_model = None # Court model, loaded on first use and kept for the life of the process
+_model_lock = threading.Lock()
+_predict_lock = threading.Lock() # The shared ultralytics predictor is not thread-safe
+_landing_executor = ThreadPoolExecutor(max_workers=1) # Runs get_landing_point alongside court detection
+
+# --- Utility: YOLO Model Loading ---
+def _get_yolo_model():
+    """Returns the shared court model, loading it on the first call."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = _load_yolo_model()
+        return _model
+
+def _yolo_export_target():
+    """The (format, path) of the accelerated export: TensorRT on CUDA, OpenVINO on CPU."""
+    stem = os.path.splitext(MODEL_PATH)[0]
+    if YOLO_HALF:
+        return 'engine', f"{stem}.engine"
+    return 'openvino', f"{stem}_openvino_model"
+
+def _load_yolo_model():
+    """
+    Loads the court model from its accelerated export when export_yolo_model()
+    has produced one, otherwise from the .pt weights. Never exports itself:
+    that can take minutes and must not run inside a request.
+    """
+    export_format, export_path = _yolo_export_target()
+    if os.path.exists(export_path):
+        try:
+            return YOLO(export_path)
+        except Exception as e:
+            logger.warning("⚠️ Could not load %s export, using %s: %s", export_format, MODEL_PATH, e)
+    model = YOLO(MODEL_PATH)
+    if YOLO_HALF:
+        model.to('cuda').half()
+    return model
+
+def export_yolo_model():
+    """
+    One-time setup step: exports the court model to TensorRT (CUDA) or
+    OpenVINO (CPU) next to the weights. Run `python -m common.homography_controller`.
+    """
+    export_format, export_path = _yolo_export_target()
+    logger.info("Exporting %s to %s...", MODEL_PATH, export_format)
+    YOLO(MODEL_PATH).export(format=export_format, half=YOLO_HALF,
+                            batch=YOLO_BATCH_SIZE, dynamic=True)
+    logger.info("✅ Court model exported to %s", export_path)
+
+# --- Utility: Most Confident Detections ---
+def _top_k_by_conf(cls, conf, class_id, k=2):
+    """Indices of the k most confident boxes of class_id, most confident first."""
+    idx = np.flatnonzero(cls == class_id)
+    if idx.size > k:
+        # O(n) partial selection; only the k winners get sorted
+        idx = idx[np.argpartition(-conf[idx], k - 1)[:k]]
+    return idx[np.argsort(-conf[idx], kind='stable')]
+
+# --- Utility: Background Frame Reader ---
+def _start_frame_reader(cap, max_frames, stride=1):
+    """
+    Decodes every stride-th of the next max_frames frames from cap on a daemon
+    thread into a bounded queue, so H.264 decode overlaps with inference.
+    Skipped frames are only grabbed, never converted. A None item marks the end.
+    """
+    frame_q = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop_event = threading.Event()
+
+    def _reader():
+        for i in range(max_frames):
+            if stop_event.is_set():
+                break
+            if i % stride:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_q.put(frame)
+        frame_q.put(None)
+
+    thread = threading.Thread(target=_reader, daemon=True)
+    thread.start()
+    return frame_q, stop_event, thread
+
+def _stop_frame_reader(frame_q, stop_event, thread):
+    """Stops the reader early and waits for it, so the capture is safe to reuse."""
+    stop_event.set()
+    while frame_q.get() is not None: # Drain so a blocked put() can finish
+        pass
+    thread.join()
+
+# --- Utility: Background Frame Writer ---
+def _start_frame_writer(write):
+    """
+    Passes frames to write() (e.g. an ffmpeg pipe's stdin.write) on a daemon
+    thread, so encoding overlaps with decode/resize. Put None on the queue to finish.
+    """
+    frame_q = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+
+    def _writer():
+        while True:
+            frame = frame_q.get()
+            if frame is None: # Identity check: iter(get, None) would compare arrays with ==
+                break
+            try:
+                write(frame.data)
+            except OSError:
+                pass # Encoder died; keep draining so put() never blocks. Its exit code reports it.
+
+    thread = threading.Thread(target=_writer, daemon=True)
+    thread.start()
+    return frame_q, thread
+
+# --- Utility: Points Inside Quad (batched) ---
+def points_in_quad(points, quad):
+    """
+    Vectorized inside test of N (x, y) points against a convex 4-vertex polygon.
+    Points on an edge count as inside, like pointPolygonTest(...) >= 0.
+    Returns an (N,) bool array.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+    q = np.asarray(quad, dtype=np.float64).reshape(4, 2)
+    edges = np.roll(q, -1, axis=0) - q # (4, 2)
+    rel = pts - q # (N, 4, 2)
+    # Sign of the cross product tells which side of each edge the point is on
+    cross = edges[:, 0]*rel[..., 1] - edges[:, 1]*rel[..., 0]
+    return (cross >= 0).all(axis=1) | (cross <= 0).all(axis=1)
+
+# --- Utility: Centered Rolling Mean ---
+def _centered_rolling_mean(values, window=SMOOTH_WINDOW):
+    """
+    Same as Series.rolling(window, center=True, min_periods=1).mean(), NaNs skipped.
+    Uses bottleneck when installed, a NaN-aware NumPy convolution otherwise.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if bn is None:
+        # Windowed sum of the valid samples divided by how many were valid.
+        # The centered slice of the 'full' convolution truncates the window at
+        # both ends like min_periods=1 ('same' breaks when len < window).
+        valid = ~np.isnan(values)
+        kernel = np.ones(window)
+        center = slice(window // 2, window // 2 + len(values))
+        sums = np.convolve(np.where(valid, values, 0.0), kernel)[center]
+        counts = np.convolve(valid.astype(np.float64), kernel)[center]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts # 0/0 -> NaN where the whole window is missing
+    # move_mean is trailing: NaN-pad both ends (NaNs are skipped) and shift
+    # the result left by half a window to center it
+    lead, half = window - 1, window // 2
+    padded = np.concatenate([np.full(lead, np.nan), values, np.full(half, np.nan)])
+    return bn.move_mean(padded, window=window, min_count=1)[lead + half:]
 
 # --- Utility: Point Inside Polygon ---
 def point_in_polygon(point, polygon):
     """Return True if point (x,y) is inside polygon (list of 4 (x,y) tuples)."""
-    poly = np.array(polygon, dtype=np.int32).reshape((-1, 2))
-    result = cv2.pointPolygonTest(poly, point, False)
-    return result >= 0
+    # Cross-product sign check; cheaper than a pointPolygonTest call for one point
+    return bool(points_in_quad([point], polygon)[0])
 
 # --- Step 1: Get Landing Point from CSV ---
 def get_landing_point(csv_path):
     if not os.path.exists(csv_path):
-        print(f"❌ CSV not found at {csv_path}")
+        logger.error("❌ CSV not found at %s", csv_path)
         return None, None, None
 
     try:
-        df = pd.read_csv(csv_path)
-        df_visible = df.copy()
-        df_visible.loc[df_visible['Visibility'] == 0, ['X', 'Y']] = np.nan
+        # pandas is only the CSV parser here; everything after runs on plain arrays
+        df = pd.read_csv(csv_path, usecols=['Visibility', 'X', 'Y'])
+        hidden = df['Visibility'].to_numpy() == 0
+        raw_xs = df['X'].to_numpy(dtype=np.float64, copy=True) # Writable even under pandas copy-on-write
+        raw_ys = df['Y'].to_numpy(dtype=np.float64, copy=True)
+        raw_xs[hidden] = np.nan
+        raw_ys[hidden] = np.nan
 
         # Smooth trajectory
-        df_visible['X_smooth'] = df_visible['X'].rolling(7, center=True, min_periods=1).mean()
-        df_visible['Y_smooth'] = df_visible['Y'].rolling(7, center=True, min_periods=1).mean()
-
-        # Direction change
-        df_visible['delta_X'] = df_visible['X_smooth'].diff()
-        df_visible['delta_Y'] = df_visible['Y_smooth'].diff()
-        
-        v1x, v1y = df_visible['delta_X'], df_visible['delta_Y']
-        v2x, v2y = df_visible['delta_X'].shift(-1), df_visible['delta_Y'].shift(-1)
-        dot = v1x*v2x + v1y*v2y
-        norm = np.sqrt(v1x**2 + v1y**2)*np.sqrt(v2x**2 + v2y**2)
-        cos_t = np.clip(dot/norm, -1.0, 1.0)
-        angle = np.degrees(np.arccos(cos_t))
-        df_visible['Direction Change'] = angle
-
-        # Detect large direction change (potential hit)
-        hits = df_visible[df_visible['Direction Change'] > 30].index.tolist()
-        if not hits:
-            print("❌ No hits found.")
+        xs = _centered_rolling_mean(raw_xs)
+        ys = _centered_rolling_mean(raw_ys)
+
+        # Direction change (plain NumPy arrays - no per-op Series alignment)
+        v1x = np.diff(xs, prepend=np.nan)
+        v1y = np.diff(ys, prepend=np.nan)
+        v2x = np.roll(v1x, -1); v2x[-1] = np.nan
+        v2y = np.roll(v1y, -1); v2y[-1] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cos_t = (v1x*v2x + v1y*v2y) / (np.hypot(v1x, v1y)*np.hypot(v2x, v2y))
+
+        # Detect large direction change (potential hit).
+        # angle > 30 deg  <=>  cos(angle) < cos(30 deg); NaNs compare False.
+        hits = np.flatnonzero(cos_t < HIT_COS_THRESHOLD)
+        if hits.size == 0:
+            logger.error("❌ No hits found.")
             return None, None, None
 
-        # Cluster hits (simple gap threshold)
-        clusters = []
-        current = [hits[0]]
-        for i in range(1, len(hits)):
-            if hits[i] - hits[i-1] <= 30:
-                current.append(hits[i])
-            else:
-                clusters.append(current)
-                current = [hits[i]]
-        clusters.append(current)
-
-        last_cluster = clusters[-1]
+        # Cluster hits (simple gap threshold). Only the last cluster is used,
+        # so just find where it starts: right after the last gap > 30 frames.
+        gaps = np.flatnonzero(np.diff(hits) > 30)
+        last_cluster = hits[gaps[-1] + 1:] if gaps.size else hits
+
+        # First hit in the last cluster with a visible (non-NaN) raw position
+        raw_x = raw_xs[last_cluster]
+        raw_y = raw_ys[last_cluster]
+        valid = ~(np.isnan(raw_x) | np.isnan(raw_y))
         landing_point = None
         landing_frame = None
-        for idx in last_cluster:
-            if not np.isnan(df_visible.loc[idx, 'X']) and not np.isnan(df_visible.loc[idx, 'Y']):
-                landing_point = (int(df_visible.loc[idx, 'X']), int(df_visible.loc[idx, 'Y']))
-                landing_frame = idx
-                print(f"✅ Landing point found at frame {landing_frame}: {landing_point}")
-                break
+        if valid.any():
+            first = int(np.argmax(valid))
+            landing_point = (int(raw_x[first]), int(raw_y[first]))
+            landing_frame = int(last_cluster[first])
+            logger.info("✅ Landing point found at frame %s: %s", landing_frame, landing_point)
         
         if landing_point is None:
-             print("❌ No landing point found in last cluster.")
+             logger.error("❌ No landing point found in last cluster.")
              return None, None, None
 
-        return landing_point, landing_frame, len(df_visible)
+        return landing_point, landing_frame, len(raw_xs)
     except Exception as e:
-        print(f"❌ Error processing CSV: {e}")
+        logger.exception("❌ Error processing CSV: %s", e)
         return None, None, None
 
+# --- Cached 2D court base image ---
+@lru_cache(maxsize=None)
+def _court_base_image(line_thickness):
+    """
+    White padded canvas with all template court lines drawn, built once per
+    thickness. Returned read-only; copy it before drawing on it.
+    """
+    img = np.full((H_2D + PADDING * 2, W_2D + PADDING * 2, 3), 255, dtype=np.uint8)
+    pts = (COURT_LINES_XY + PADDING).astype(np.int32)
+    cv2.polylines(img, list(pts), False, (0, 0, 0), line_thickness) # Black lines
+    img.flags.writeable = False
+    return img
+
 # --- Function to draw FULL 2D court map ---
 def generate_2d_illustration_full(landing_point_2d, in_zone, output_dir, base_filename):
     """
@@ -129,17 +353,13 @@ def generate_2d_illustration_full(landing_point_2d, in_zone, output_dir, base_fi
     Saves it as an image and returns the web-accessible path.
     """
     try:
-        # Create a blank white image
-        img_2d = np.ones((H_2D + PADDING * 2, W_2D + PADDING * 2, 3), dtype=np.uint8) * 255
+        # Start from the cached court drawing (white canvas + black lines)
+        img_2d = _court_base_image(3).copy()
         
         # Function to offset points by padding
         def p(point):
             return (int(point[0] + PADDING), int(point[1] + PADDING))
 
-        # Draw all court lines from the template
-        for name, (p1, p2) in COURT_TEMPLATE.items():
-            cv2.line(img_2d, p(p1), p(p2), (0, 0, 0), 3) # Black lines
-
         # Define the "IN" zone polygon
         in_zone_template = np.array([
             p(COURT_TEMPLATE["left_inner_line"][0]),
@@ -167,11 +387,11 @@ def generate_2d_illustration_full(landing_point_2d, in_zone, output_dir, base_fi
         
         # Return the web-accessible path
         web_image_path = os.path.join(os.path.basename(output_dir), output_filename)
-        print(f"✅ 2D full illustration saved to: {output_image_path}")
+        logger.info("✅ 2D full illustration saved to: %s", output_image_path)
         return web_image_path
         
     except Exception as e:
-        print(f"❌ Error generating 2D full illustration: {e}")
+        logger.exception("❌ Error generating 2D full illustration: %s", e)
         return None
 
 # --- Function to draw ZOOMED 2D court map ---
@@ -182,11 +402,10 @@ def generate_2d_illustration_zoom(landing_point_2d, in_zone, output_dir, base_fi
     """
     try:
         # 1. Create the base full-court image (in memory)
-        img_base = np.ones((H_2D + PADDING * 2, W_2D + PADDING * 2, 3), dtype=np.uint8) * 255
+        # Cached and read-only: it is only cropped and resized, never drawn on
+        img_base = _court_base_image(5) # Thicker lines for zoom
         def p(point):
             return (int(point[0] + PADDING), int(point[1] + PADDING))
-        for name, (p1, p2) in COURT_TEMPLATE.items():
-            cv2.line(img_base, p(p1), p(p2), (0, 0, 0), 5) # Thicker lines for zoom
 
         # 2. Define zoom parameters
         ZOOM_BOX_SIZE = 300 # Pixel radius from landing point to crop
@@ -203,14 +422,14 @@ def generate_2d_illustration_zoom(landing_point_2d, in_zone, output_dir, base_fi
         
         # Validate crop region - ensure it's not empty
         if x2 <= x1 or y2 <= y1:
-            print(f"⚠️  Warning: Invalid crop region for zoom illustration (landing point outside bounds). Skipping zoom illustration.")
+            logger.warning("⚠️  Warning: Invalid crop region for zoom illustration (landing point outside bounds). Skipping zoom illustration.")
             return None
         
         zoom_crop = img_base[y1:y2, x1:x2]
         
         # Validate that crop is not empty
         if zoom_crop.size == 0:
-            print(f"⚠️  Warning: Empty crop region for zoom illustration. Skipping zoom illustration.")
+            logger.warning("⚠️  Warning: Empty crop region for zoom illustration. Skipping zoom illustration.")
             return None
 
         # 5. Resize to final output size
@@ -232,41 +451,13 @@ def generate_2d_illustration_zoom(landing_point_2d, in_zone, output_dir, base_fi
         
         # 9. Return the web-accessible path
         web_image_path = os.path.join(os.path.basename(output_dir), output_filename)
-        print(f"✅ 2D zoom illustration saved to: {output_image_path}")
+        logger.info("✅ 2D zoom illustration saved to: %s", output_image_path)
         return web_image_path
 
     except Exception as e:
-        print(f"❌ Error generating 2D zoom illustration: {e}")
+        logger.exception("❌ Error generating 2D zoom illustration: %s", e)
         return None
 
-# --- Helper function to re-encode video for web compatibility ---
-def _reencode_video_for_web(raw_output_path, web_output_path, video_type="video", preserve_fps=None):
-    """Helper function to re-encode raw video with ffmpeg for web compatibility."""
-    try:
-        print(f"Re-encoding {video_type} for web...")
-        command = [
-            'ffmpeg',
-            '-y',
-            '-i', raw_output_path,
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',  # Use ultrafast for speed
-            '-pix_fmt', 'yuv420p',
-            '-movflags', '+faststart',  # Enable fast start for web playback
-        ]
-        # Preserve frame rate if specified (important for slow motion)
-        if preserve_fps is not None:
-            command.extend(['-r', str(preserve_fps)])
-        command.append(web_output_path)
-        subprocess.run(command, check=True, capture_output=True, text=True)
-        os.remove(raw_output_path)  # Clean up raw file
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ ERROR: ffmpeg re-encoding failed for {video_type}.")
-        print(f"ffmpeg stderr: {e.stderr}")
-        if os.path.exists(raw_output_path):
-            os.remove(raw_output_path)
-        return False
-
 # --- Function to create full slow-motion video (for error cases) ---
 def create_full_slowmotion_video(original_video_path, output_dir, base_filename):
     """
@@ -278,14 +469,14 @@ def create_full_slowmotion_video(original_video_path, output_dir, base_filename)
         web_output_path = os.path.join(output_dir, web_filename)
         SLOWMO_FACTOR = 8  # 8x slower
         
-        print(f"--- Creating full slow-motion video using ffmpeg (fast method) ---")
+        logger.info("--- Creating full slow-motion video using ffmpeg (fast method) ---")
         
         # Use ffmpeg's setpts filter to slow down video - much faster than frame-by-frame
         # setpts=4*PTS means each frame is shown 4x longer (4x slower)
         # Need to get original FPS first
         cap = cv2.VideoCapture(original_video_path)
         if not cap.isOpened():
-            print(f"❌ Error: Cannot open video for slow-motion: {original_video_path}")
+            logger.error("❌ Error: Cannot open video for slow-motion: %s", original_video_path)
             return None
         original_fps = cap.get(cv2.CAP_PROP_FPS)
         cap.release()
@@ -308,17 +499,17 @@ def create_full_slowmotion_video(original_video_path, output_dir, base_filename)
         
         try:
             subprocess.run(command, check=True, capture_output=True, text=True)
-            print(f"✅ Full slow-motion video saved to: {web_output_path}")
+            logger.info("✅ Full slow-motion video saved to: %s", web_output_path)
             # Return web-accessible path
             web_video_path = os.path.join(os.path.basename(output_dir), web_filename)
             return web_video_path
         except subprocess.CalledProcessError as e:
-            print(f"❌ ERROR: ffmpeg slow-motion creation failed.")
-            print(f"ffmpeg stderr: {e.stderr}")
+            logger.exception("❌ ffmpeg slow-motion creation failed.")
+            logger.error("ffmpeg stderr: %s", e.stderr)
             return None
         
     except Exception as e:
-        print(f"❌ Error creating full slow-motion video: {e}")
+        logger.exception("❌ Error creating full slow-motion video: %s", e)
         return None
 
 # --- Function to create slow-motion zoom replay ---
@@ -333,8 +524,8 @@ def create_slow_zoom_replay(original_video_path, landing_frame, landing_point, o
 
 # --- Fallback function using OpenCV for slow-motion zoom replay ---
 def _create_slow_zoom_replay_opencv(original_video_path, landing_frame, landing_point, output_dir, base_filename, fps):
-    """Fallback method using OpenCV if ffmpeg fails."""
-    raw_output_path = None
+    """Crops and upscales around the landing point with OpenCV, encoding straight to web H.264."""
+    proc = None
     try:
         cap = cv2.VideoCapture(original_video_path)
         if not cap.isOpened():
@@ -350,28 +541,29 @@ def _create_slow_zoom_replay_opencv(original_video_path, landing_frame, landing_
         start_frame = max(0, landing_frame - FRAMES_BEFORE)
         cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
         
-        raw_filename = f"raw_replay_{os.path.splitext(base_filename)[0]}.mp4"
-        raw_output_path = os.path.join(output_dir, raw_filename)
         web_filename = f"yolo_homog_{os.path.splitext(base_filename)[0]}_replay.mp4"
         web_output_path = os.path.join(output_dir, web_filename)
         
-        # Output at original fps - writing each frame 8 times makes it 8x slower
-        # The key is: we write 8 copies of each frame at original fps, so playback is 8x slower
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        # cv2.VideoWriter expects frame size as a tuple (width, height)
-        out = cv2.VideoWriter(raw_output_path, fourcc, fps, FINAL_REPLAY_SIZE)
-
-        if not out.isOpened():
-            cap.release()
-            return None
+        # Output at original fps - writing each frame 8 times makes it 8x slower.
+        # Frames are piped raw into ffmpeg, so the replay is encoded once, directly
+        # to web-ready H.264, instead of mp4v followed by a libx264 re-encode.
+        proc = open_h264_pipe(web_output_path, FINAL_REPLAY_SIZE[0], FINAL_REPLAY_SIZE[1], fps)
 
         lp_x, lp_y = landing_point
         
-        print(f"OpenCV slow-mo: Writing {CLIP_DURATION} frames, each duplicated {SLOWMO_FACTOR} times at {fps} fps")
-        print(f"This should create {CLIP_DURATION * SLOWMO_FACTOR} frames total, playing at {fps} fps = {CLIP_DURATION * SLOWMO_FACTOR / fps:.2f} seconds")
+        logger.info("OpenCV slow-mo: Writing %s frames, each duplicated %s times at %s fps", CLIP_DURATION, SLOWMO_FACTOR, fps)
+        logger.info("This should create %s frames total, playing at %s fps = %.2f seconds", CLIP_DURATION * SLOWMO_FACTOR, fps, CLIP_DURATION * SLOWMO_FACTOR / fps)
 
+        # Preallocated resize targets, used round-robin. The writer queue holds at
+        # most FRAME_QUEUE_SIZE duplicates (two distinct frames) and the writer
+        # thread one more, so a buffer is free again two frames later.
+        zoom_bufs = [np.empty((FINAL_REPLAY_SIZE[1], FINAL_REPLAY_SIZE[0], 3), np.uint8)
+                     for _ in range(FRAME_QUEUE_SIZE // SLOWMO_FACTOR + 2)]
+        frame = None
+
+        write_q, writer = _start_frame_writer(proc.stdin.write)
         for frame_idx in range(CLIP_DURATION):
-            ret, frame = cap.read()
+            ret, frame = cap.read(frame) # Decode into the previous frame's buffer
             if not ret:
                 break
             
@@ -381,30 +573,57 @@ def _create_slow_zoom_replay_opencv(original_video_path, landing_frame, landing_
             y2 = min(frame.shape[0], lp_y + ZOOM_BOX_SIZE)
             
             crop = frame[y1:y2, x1:x2]
-            zoomed_frame = cv2.resize(crop, FINAL_REPLAY_SIZE, interpolation=cv2.INTER_LINEAR)
+            zoomed_frame = zoom_bufs[frame_idx % len(zoom_bufs)]
+            cv2.resize(crop, FINAL_REPLAY_SIZE, dst=zoomed_frame, interpolation=cv2.INTER_LINEAR)
             
             # Write each frame SLOWMO_FACTOR times to create slow motion
             for dup_idx in range(SLOWMO_FACTOR):
-                out.write(zoomed_frame)
-        
+                write_q.put(zoomed_frame)
+
+        write_q.put(None)
+        writer.join()
         cap.release()
-        out.release()
         
-        # Re-encode preserving the original fps (important for slow motion)
-        if _reencode_video_for_web(raw_output_path, web_output_path, "slow-mo replay", preserve_fps=fps):
+        if close_h264_pipe(proc, web_output_path):
             web_video_path = os.path.join(os.path.basename(output_dir), web_filename)
             return web_video_path
         else:
             return None
         
     except Exception as e:
-        print(f"❌ Error in OpenCV fallback: {e}")
+        logger.exception("❌ Error in OpenCV fallback: %s", e)
         if 'cap' in locals() and cap.isOpened():
             cap.release()
-        if 'out' in locals() and out.isOpened():
-            out.release()
-        if raw_output_path and os.path.exists(raw_output_path):
-            os.remove(raw_output_path)
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+        return None
+
+# --- Function to copy the original video for web playback ---
+def _copy_video_for_web(video_path, output_dir, base_filename):
+    """
+    Stream-copies the original video next to the other outputs (no re-encode).
+    Returns the web-accessible path, or None so app.py falls back to the TFLite video.
+    """
+    web_filename = f"yolo_homog_{base_filename}"
+    web_output_path = os.path.join(output_dir, web_filename)
+    try:
+        command = [
+            'ffmpeg',
+            '-y',
+            '-i', video_path,
+            '-c', 'copy',  # Stream copy, no re-encoding - very fast
+            # Fragmented MP4 puts moov up front as it writes, so unlike
+            # +faststart there is no second pass rewriting the whole file
+            '-movflags', FRAGMENTED_MP4_FLAGS,
+            web_output_path
+        ]
+        subprocess.run(command, check=True, capture_output=True, text=True)
+        logger.info("✅ Video output saved (copy): %s", web_output_path)
+        return os.path.join(os.path.basename(output_dir), web_filename)
+    except Exception as e:
+        logger.warning("⚠️ Could not copy video, will use TFLite output: %s", e)
+        if os.path.exists(web_output_path):
+            os.remove(web_output_path)
         return None
 
 # --- Step 2: Main Video + YOLO + Homography ---
@@ -417,11 +636,13 @@ def run_homography_check(video_path, csv_path, output_dir, manual_points=None):
     web_2d_full_path = None
     web_2d_zoom_path = None
     web_replay_path = None
-    raw_output_path = None # Initialize
     H = None
     H_inv = None
     
     try:
+        # Landing detection only needs the CSV, so it runs while the model loads and detects
+        landing_future = _landing_executor.submit(get_landing_point, csv_path)
+
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             return False, f"Cannot open video file: {video_path}", None, None, None
@@ -429,17 +650,15 @@ def run_homography_check(video_path, csv_path, output_dir, manual_points=None):
         # Set buffer size to reduce I/O overhead
         cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = cap.get(cv2.CAP_PROP_FPS)
 
         # --- NEW: Handle Homography (Auto vs Semi-Auto) ---
         # This can be done immediately, doesn't need CSV
         if manual_points:
-            print("✅ Using manual homography points.")
+            logger.info("✅ Using manual homography points.")
             detected_pts = np.array(manual_points, dtype=np.float32)
-            print(f"   Template points: {TEMPLATE_PTS_HOMOGRAPHY.tolist()}")
-            print(f"   Detected points: {detected_pts.tolist()}")
+            logger.info("   Template points: %s", TEMPLATE_PTS_HOMOGRAPHY.tolist())
+            logger.info("   Detected points: %s", detected_pts.tolist())
             H, mask = cv2.findHomography(TEMPLATE_PTS_HOMOGRAPHY, detected_pts)
             if H is None:
                 cap.release()
@@ -448,86 +667,79 @@ def run_homography_check(video_path, csv_path, output_dir, manual_points=None):
             # Validate homography quality by checking if it produces reasonable results
             test_pt_template = np.array([[[TEMPLATE_PTS_HOMOGRAPHY[0][0], TEMPLATE_PTS_HOMOGRAPHY[0][1]]]], dtype=np.float32)
             test_pt_mapped = cv2.perspectiveTransform(test_pt_template, H)
-            print(f"   Homography validation: Template point {TEMPLATE_PTS_HOMOGRAPHY[0]} maps to {test_pt_mapped[0][0]}")
+            logger.info("   Homography validation: Template point %s maps to %s", TEMPLATE_PTS_HOMOGRAPHY[0], test_pt_mapped[0][0])
             
-            H_inv = np.linalg.inv(H)
+            H_inv = invert_homography(H)
         else:
-            print("✅ Running automatic YOLO court detection...")
+            logger.info("✅ Running automatic YOLO court detection...")
             if not os.path.exists(MODEL_PATH):
                 return False, f"YOLO model not found at {MODEL_PATH}. Please place it in the root directory.", None, None, None
-            model = YOLO(MODEL_PATH)
-            
-            # Find homography from the first few frames
-            for _ in range(int(fps * 3)): # Try for 3 seconds
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                results = model(frame, conf=CONFIDENCE_THRESHOLD, stream=True, verbose=False)
-                for r in results:
-                    boxes = r.boxes
-                    if boxes is not None and len(boxes) > 0:
-                        cls = boxes.cls.cpu().numpy().astype(int)
-                        conf = boxes.conf.cpu().numpy()
-                        xyxy = boxes.xyxy.cpu().numpy()
-                        centers = [(int((x1+x2)/2), int((y1+y2)/2)) for x1, y1, x2, y2 in xyxy]
-
-                        R1 = [(c, p) for c, p, cid in zip(conf, centers, cls) if cid == 2]
-                        R3 = [(c, p) for c, p, cid in zip(conf, centers, cls) if cid == 3]
-                        R1.sort(reverse=True, key=lambda x: x[0])
-                        R3.sort(reverse=True, key=lambda x: x[0])
-
-                        if len(R1) >= 2 and len(R3) >= 2:
-                            detected_pts = np.array([R1[0][1], R1[1][1], R3[0][1], R3[1][1]], dtype=np.float32)
-                            H, _ = cv2.findHomography(TEMPLATE_PTS_HOMOGRAPHY, detected_pts)
-                            H_inv = np.linalg.inv(H) 
-                            print("✅ Auto-homography computed.")
-                            break # Exit loop once H is found
-                if H is not None:
-                    break
+            model = _get_yolo_model()
             
+            # Find homography from the first few frames, running YOLO on
+            # batches of frames so each call amortizes the inference overhead
+            max_frames = int(fps * 3) # Try for 3 seconds
+            frame_q, stop_event, reader = _start_frame_reader(cap, max_frames, YOLO_FRAME_STRIDE)
+            video_ended = False
+            try:
+                while H is None and not video_ended:
+                    batch = []
+                    while len(batch) < YOLO_BATCH_SIZE:
+                        frame = frame_q.get()
+                        if frame is None:
+                            video_ended = True
+                            break
+                        batch.append(frame)
+                    if not batch:
+                        break
+                    with _predict_lock:
+                        results = model.predict(batch, conf=CONFIDENCE_THRESHOLD, half=YOLO_HALF, verbose=False)
+                    del batch
+                    for r in results:
+                        boxes = r.boxes
+                        if boxes is not None and len(boxes) > 0:
+                            # One device->host copy of [x1, y1, x2, y2, (id,) conf, cls], sliced locally
+                            data = boxes.data.cpu().numpy()
+                            xyxy = data[:, :4]
+                            conf = data[:, -2]
+                            cls = data[:, -1].astype(int)
+                            centers = ((xyxy[:, 0:2] + xyxy[:, 2:4]) * 0.5).astype(np.int32)
+
+                            # Two most confident R1 (class 2) and R3 (class 3) keypoints
+                            top_r1 = _top_k_by_conf(cls, conf, 2)
+                            top_r3 = _top_k_by_conf(cls, conf, 3)
+
+                            if len(top_r1) >= 2 and len(top_r3) >= 2:
+                                detected_pts = centers[np.concatenate([top_r1, top_r3])].astype(np.float32)
+                                H, _ = cv2.findHomography(TEMPLATE_PTS_HOMOGRAPHY, detected_pts)
+                                H_inv = invert_homography(H) 
+                                logger.info("✅ Auto-homography computed.")
+                                break # Exit loop once H is found
+            finally:
+                # Also on errors: the reader must stop before cap is released
+                if not video_ended:
+                    _stop_frame_reader(frame_q, stop_event, reader)
+                reader.join()
+
             if H is None:
                 cap.release()
                 return False, "Automatic court detection failed. Try Semi-Auto mode.", None, None, None
 
-        # Reset video capture to frame 0 for processing
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        
         base_filename = os.path.basename(video_path)
         
         # --- Pre-calculate mapped lines and intersection points (can do this before CSV is ready) ---
-        mapped_lines = {}
-        for name, (p1, p2) in COURT_TEMPLATE.items():
-            line = np.array([[p1, p2]], dtype=np.float32)
-            mapped_line = cv2.perspectiveTransform(line, H)[0]
-            mapped_lines[name] = (tuple(mapped_line[0]), tuple(mapped_line[1]))
-
-        i1 = line_intersection(*mapped_lines["baseline_bottom"], *mapped_lines["left_inner_line"])
-        i2 = line_intersection(*mapped_lines["baseline_bottom"], *mapped_lines["right_inner_line"])
-        i3 = line_intersection(*mapped_lines["net"], *mapped_lines["left_inner_line"])
-        i4 = line_intersection(*mapped_lines["net"], *mapped_lines["right_inner_line"])
-        
+        # All line endpoints go through a single perspectiveTransform call
+        mapped = cv2.perspectiveTransform(COURT_LINES_XY.reshape(1, -1, 2), H).reshape(-1, 2, 2)
+
+        # All four IN/OUT zone corners in one vectorized intersection
+        corners = line_intersections(mapped[ZONE_LINES_A], mapped[ZONE_LINES_B])
+
         intersection_pts = None
-        if all([i1, i2, i3, i4]):
-            intersection_pts = np.array([i1, i2, i4, i3], dtype=np.int32)
-            print("✅ IN/OUT zone (singles) points:", intersection_pts.tolist())
-
-        # Pre-convert intersection points to int32 once
-        intersection_pts_int = None
-        if intersection_pts is not None:
-            intersection_pts_int = intersection_pts.reshape(-1, 1, 2).astype(np.int32)
-        
-        # Pre-convert line points to int32 tuples for faster drawing
-        mapped_lines_int = {}
-        for name, (p1, p2) in mapped_lines.items():
-            mapped_lines_int[name] = (tuple(np.int32(p1)), tuple(np.int32(p2)))
-
-        # Pre-create a base overlay image with court lines (draw once, reuse)
-        base_overlay = np.zeros((height, width, 3), dtype=np.uint8)
-        for name, (p1, p2) in mapped_lines_int.items():
-            cv2.line(base_overlay, p1, p2, (255, 255, 0), 2)
-        if intersection_pts_int is not None:
-            cv2.polylines(base_overlay, [intersection_pts_int], True, (0, 0, 255), 3)
-        
+        if np.isfinite(corners).all():
+            # Stored in OpenCV contour layout (N, 1, 2) for the polygon test
+            intersection_pts = corners.astype(np.int32).reshape(-1, 1, 2)
+            logger.info("✅ IN/OUT zone (singles) points: %s", intersection_pts.reshape(-1, 2).tolist())
+
         # CSV should already be ready (TFLite thread completed before this function is called)
         # But verify it exists and is readable
         if not os.path.exists(csv_path):
@@ -545,29 +757,26 @@ def run_homography_check(video_path, csv_path, output_dir, manual_points=None):
             return False, f"CSV file is not readable: {e}", None, None, None
         
         # Get landing point from CSV
-        landing_point, landing_frame, total_frames = get_landing_point(csv_path)
+        landing_point, landing_frame, total_frames = landing_future.result()
         if landing_point is None:
             cap.release()
             return False, "No valid landing point found in CSV. Cannot determine IN/OUT.", None, None, None
         
         # --- Determine IN/OUT result ---
-        # Reset to start and seek to landing frame to determine result
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        frame_idx = 0
-        landing_frame_img = None
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if frame_idx == landing_frame:
-                landing_frame_img = frame
+        # Check the landing frame is decodable. Court detection already decoded
+        # the start of the video, so carry on from there instead of seeking to 0.
+        # grab() decodes without the YUV->BGR conversion; the pixels are never used
+        frame_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        landing_frame_read = landing_frame < frame_idx
+        while not landing_frame_read:
+            if not cap.grab():
                 break
+            landing_frame_read = frame_idx == landing_frame
             frame_idx += 1
         
         cap.release()
         
-        if landing_frame_img is None:
+        if not landing_frame_read:
             return False, "Could not read landing frame", None, None, None
         
         # Determine IN/OUT
@@ -576,64 +785,49 @@ def run_homography_check(video_path, csv_path, output_dir, manual_points=None):
             return False, "Could not determine IN/OUT zone. Court detection may be incorrect.", None, None, None
         
         in_zone = point_in_polygon(landing_point, intersection_pts)
-        print(f"🏸 Shuttle {'IN' if in_zone else 'OUT'} detected at frame {landing_frame}")
-        print(f"   Landing point (video coords): {landing_point}")
-        print(f"   IN/OUT zone points (video coords): {intersection_pts.tolist()}")
-        
-        # Generate 2D illustrations and replay (these are fast)
-        web_2d_full_path = None
-        web_2d_zoom_path = None
-        web_replay_path = None
-        
-        if H_inv is not None:
-            lp_array = np.array([[landing_point]], dtype=np.float32)
-            lp_2d_array = cv2.perspectiveTransform(lp_array, H_inv)
-            lp_2d = tuple(lp_2d_array[0][0].astype(int))
-            print(f"✅ Mapped 2D landing point: {lp_2d}")
-            
-            # Validate 2D coordinates are reasonable (within court bounds with some margin)
-            if lp_2d[0] < -W_2D or lp_2d[0] > W_2D * 2 or lp_2d[1] < -H_2D or lp_2d[1] > H_2D * 2:
-                print(f"⚠️  Warning: Mapped 2D coordinates {lp_2d} seem out of bounds. Homography may be inaccurate.")
-            
-            web_2d_full_path = generate_2d_illustration_full(
-                lp_2d, in_zone, output_dir, base_filename
-            )
-            web_2d_zoom_path = generate_2d_illustration_zoom(
-                lp_2d, in_zone, output_dir, base_filename
-            )
-            web_replay_path = create_slow_zoom_replay(
-                video_path, landing_frame, landing_point, output_dir, base_filename, fps
-            )
-        
-        # Create a simple video output by copying the original video (fast, no annotation)
-        # The TFLite video already has shuttle tracking, so we can use that or just copy original
-        web_filename = f"yolo_homog_{base_filename}"
-        web_output_path = os.path.join(output_dir, web_filename)
-        
-        # Simply copy the original video using ffmpeg (very fast)
-        try:
-            command = [
-                'ffmpeg',
-                '-y',
-                '-i', video_path,
-                '-c', 'copy',  # Stream copy, no re-encoding - very fast
-                '-movflags', '+faststart',
-                web_output_path
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-            print(f"✅ Video output saved (copy): {web_output_path}")
-            web_video_path = os.path.join(os.path.basename(output_dir), web_filename)
-        except Exception as e:
-            print(f"⚠️  Warning: Could not copy video, will use TFLite output: {e}")
-            web_video_path = None  # app.py will use TFLite video instead
+        logger.info("🏸 Shuttle %s detected at frame %s", 'IN' if in_zone else 'OUT', landing_frame)
+        logger.info("   Landing point (video coords): %s", landing_point)
+        logger.info("   IN/OUT zone points (video coords): %s", intersection_pts.reshape(-1, 2).tolist())
+        
+        # The illustrations, the replay and the output video copy are independent,
+        # so they run concurrently; the replay and copy are mostly ffmpeg/decode time
+        futures = {}
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures['video'] = pool.submit(_copy_video_for_web, video_path, output_dir, base_filename)
+
+            if H_inv is not None:
+                lp_array = np.array([[landing_point]], dtype=np.float32)
+                lp_2d_array = cv2.perspectiveTransform(lp_array, H_inv)
+                lp_2d = tuple(lp_2d_array[0][0].astype(int))
+                logger.info("✅ Mapped 2D landing point: %s", lp_2d)
+                
+                # Validate 2D coordinates are reasonable (within court bounds with some margin)
+                if lp_2d[0] < -W_2D or lp_2d[0] > W_2D * 2 or lp_2d[1] < -H_2D or lp_2d[1] > H_2D * 2:
+                    logger.warning("⚠️  Warning: Mapped 2D coordinates %s seem out of bounds. Homography may be inaccurate.", lp_2d)
+                
+                futures['full'] = pool.submit(
+                    generate_2d_illustration_full, lp_2d, in_zone, output_dir, base_filename
+                )
+                futures['zoom'] = pool.submit(
+                    generate_2d_illustration_zoom, lp_2d, in_zone, output_dir, base_filename
+                )
+                futures['replay'] = pool.submit(
+                    create_slow_zoom_replay, video_path, landing_frame, landing_point, output_dir, base_filename, fps
+                )
+
+        # Each task handles its own errors and returns None on failure
+        web_video_path = futures['video'].result()
+        web_2d_full_path = futures['full'].result() if 'full' in futures else None
+        web_2d_zoom_path = futures['zoom'].result() if 'zoom' in futures else None
+        web_replay_path = futures['replay'].result() if 'replay' in futures else None
         
         return True, web_video_path, web_2d_full_path, web_2d_zoom_path, web_replay_path
 
     except Exception as e:
-        print(f"❌ Error during homography processing: {e}")
+        logger.exception("❌ Error during homography processing: %s", e)
         if 'cap' in locals() and cap.isOpened(): cap.release()
-        if 'out' in locals() and out.isOpened(): out.release()
-        if 'pbar' in locals(): pbar.close()
-        if 'web_output_path' in locals() and os.path.exists(web_output_path):
-             os.remove(web_output_path)
-        return False, str(e), None, None, None
\ No newline at end of file
+        return False, str(e), None, None, None
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    export_yolo_model()
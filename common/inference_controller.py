@@ -1,10 +1,14 @@
+import logging
 import cv2
 import numpy as np
 from ai_edge_litert.interpreter import Interpreter
 from tqdm import tqdm
 import os
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+import queue
+import threading
+from utils.ffmpeg_pipe import open_h264_pipe, close_h264_pipe
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 HEIGHT = 256
@@ -13,54 +17,155 @@ SEQ_LEN = 8
 IN_CHANNELS = (SEQ_LEN + 1) * 3
 BATCH_SIZE = 16  # Increased batch size for better throughput
 TFLITE_MODEL_PATH = 'tracknet_trained.int8.tflite' # Assumes model is in the root project dir
+TFLITE_NUM_THREADS = os.cpu_count() or 1 # XNNPACK (on by default in LiteRT) runs multi-threaded
+SEQUENCE_POOL_SIZE = 2 * BATCH_SIZE # Sequence buffers in flight (~56MB each at 1080p): one batch in invoke(), one decoding/encoding
 
-def get_object_center(heatmap):
-    """Calculates the center of the largest contour in a binary heatmap (optimized)."""
-    # Use threshold directly without full conversion for speed
-    h_pred = (heatmap > 0.5).astype(np.uint8)
-    if np.sum(h_pred) == 0:
-        return 0, 0
-    
-    # Use RETR_EXTERNAL and CHAIN_APPROX_SIMPLE for faster contour detection
-    cnts, _ = cv2.findContours(h_pred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not cnts:
-        return 0, 0
-    
-    # Find largest contour by area (optimized)
-    largest_contour = max(cnts, key=cv2.contourArea)
-    x, y, w, h = cv2.boundingRect(largest_contour)
-    cx_pred = int(x + w / 2)
-    cy_pred = int(y + h / 2)
-    return cx_pred, cy_pred
+# cv2.resize splits large images across OpenCV's own thread pool
+cv2.setNumThreads(os.cpu_count() or 1)
 
-def _preprocess_sequence(seq, width, height):
-    """Preprocess a sequence of frames (resize and concatenate)."""
-    frames = [cv2.resize(img, (width, height)) for img in seq]
-    concat = np.concatenate(frames, axis=2)
-    return concat
+def centers_batch(h_pred_bool):
+    """
+    Vectorized object centers for a (B, H, W, F) bool heatmap tensor in the
+    model's native NHWC layout: the center of the bounding box of all positive
+    pixels in each map, (0, 0) where empty. For a single-ball heatmap this is
+    the center of the ball's blob, with no findContours call per frame.
+    Returns (cx, cy) int arrays of shape (B, F).
+    """
+    b, h, w, f = h_pred_bool.shape
+    if not h_pred_bool.any():
+        # No ball anywhere in the batch: one flat scan instead of the reductions
+        return np.zeros((b, f), dtype=np.intp), np.zeros((b, f), dtype=np.intp)
+    rows_any = h_pred_bool.any(axis=2) # (B, H, F)
+    cols_any = h_pred_bool.any(axis=1) # (B, W, F)
+    has = rows_any.any(axis=1)
+    y0 = rows_any.argmax(axis=1)
+    y1 = h - rows_any[:, ::-1].argmax(axis=1)
+    x0 = cols_any.argmax(axis=1)
+    x1 = w - cols_any[:, ::-1].argmax(axis=1)
+    cx = np.where(has, (x0 + x1) // 2, 0)
+    cy = np.where(has, (y0 + y1) // 2, 0)
+    return cx, cy
 
-def _postprocess_frame(args):
-    """Post-process a single frame: find center, draw circle, prepare CSV line."""
-    frame, heatmap, frame_idx, ratio = args
-    if heatmap is None:
-        # Last frame case - no prediction
-        return None
-    
-    # Only copy if we need to modify (optimization)
-    cx_pred, cy_pred = get_object_center(heatmap)
-    cx_pred_orig, cy_pred_orig = int(ratio * cx_pred), int(ratio * cy_pred)
-    vis = 1 if cx_pred > 0 or cy_pred > 0 else 0
-    
-    if vis == 1:
-        # Only copy if we need to draw
-        img = frame.copy()
-        cv2.circle(img, (cx_pred_orig, cy_pred_orig), 5, (0, 0, 255), -1)
+# --- Background I/O Stages ---
+def _start_sequence_reader(cap, frame_h, free_q):
+    """
+    Decodes SEQ_LEN + 1 frames at a time on a daemon thread, straight into a
+    tall (9 * frame_h, frame_w, 3) buffer taken from free_q, so a sequence is
+    a single image for both the resize and the encoder pipe. The reader waits
+    for the writer to hand buffers back, so the pool caps memory while
+    cap.read() still overlaps with inference. A shorter buffer is the partial
+    final sequence; a None item marks the end. A decode error is stored in the
+    returned errors list before the end marker is sent.
+    """
+    frame_q = queue.Queue() # Bounded by the pool size
+    stop_event = threading.Event()
+    errors = []
+    seq_frames = SEQ_LEN + 1
+
+    def _reader():
+        try:
+            while not stop_event.is_set():
+                try:
+                    seq = free_q.get(timeout=0.1) # Re-check stop_event while the pool is empty
+                except queue.Empty:
+                    continue
+                n = 0
+                while n < seq_frames:
+                    view = seq[n*frame_h:(n+1)*frame_h]
+                    success, frame = cap.read(view) # Decodes in place when the size matches
+                    if not success:
+                        break
+                    if frame is not view:
+                        view[...] = frame
+                    n += 1
+                if n == seq_frames:
+                    frame_q.put(seq)
+                else:
+                    if n:
+                        frame_q.put(seq[:n*frame_h])
+                    break
+        except Exception as e:
+            errors.append(e) # Otherwise the end marker below looks like a clean end of video
+        finally:
+            frame_q.put(None)
+
+    thread = threading.Thread(target=_reader, daemon=True)
+    thread.start()
+    return frame_q, stop_event, errors, thread
+
+def _stop_frame_reader(frame_q, stop_event, thread):
+    """Stops the reader early and waits for it, so the capture is safe to release."""
+    stop_event.set()
+    while frame_q.get() is not None: # Wait for the end marker
+        pass
+    thread.join()
+
+def _start_result_writer(out, csv_path, free_q):
+    """
+    Writes (sequences, csv_text) batches to the encoder pipe and the CSV on a
+    daemon thread, so encoding overlaps with inference. Each sequence buffer
+    goes back to free_q once written. The CSV stays open for the whole run and
+    gets one write per batch. Put None on the queue to finish.
+    The first error (opening the CSV or any write) is stored in the returned
+    errors list; the main loop checks it between batches.
+    """
+    write_q = queue.Queue() # Bounded by the pool size
+    errors = []
+
+    def _writer():
+        finished = False
+        try:
+            with open(csv_path, 'a') as f_csv:
+                while True:
+                    item = write_q.get()
+                    if item is None:
+                        finished = True
+                        break
+                    sequences, csv_text = item
+                    try:
+                        for seq in sequences: # 9 contiguous frames per write
+                            out.stdin.write(seq.data)
+                        f_csv.write(csv_text)
+                    finally:
+                        for seq in sequences:
+                            free_q.put(seq)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # After an error, keep recycling buffers until the end marker so
+            # neither the reader nor the main loop waits on a dead writer
+            while not finished:
+                item = write_q.get()
+                if item is None:
+                    break
+                for seq in item[0]:
+                    free_q.put(seq)
+
+    thread = threading.Thread(target=_writer, daemon=True)
+    thread.start()
+    return write_q, errors, thread
+
+def _preprocess_sequence(seq, out, scratch_u8):
+    """
+    Resizes a tall (9 * h, w, 3) sequence buffer (in one cv2.resize call when
+    h >= HEIGHT) and scatters it into one (HEIGHT, WIDTH, IN_CHANNELS) slot of
+    the batch buffer, scaling to [0, 1] as it goes.
+    scratch_u8 is a reusable (9 * HEIGHT, WIDTH, 3) uint8 buffer.
+    """
+    seq_frames = SEQ_LEN + 1
+    frame_h = len(seq) // seq_frames
+    if frame_h >= HEIGHT:
+        # Frame boundaries line up with output rows, so for a downscale this
+        # is the same as resizing each frame on its own
+        cv2.resize(seq, (WIDTH, seq_frames * HEIGHT), dst=scratch_u8)
     else:
-        # No modification needed, use original frame
-        img = frame
-    
-    csv_line = f'{frame_idx},{vis},{cx_pred_orig},{cy_pred_orig}\n'
-    return img, csv_line
+        # Upscaled boundary rows would be interpolated from the neighbouring frame
+        for f in range(seq_frames):
+            cv2.resize(seq[f*frame_h:(f+1)*frame_h], (WIDTH, HEIGHT), dst=scratch_u8[f*HEIGHT:(f+1)*HEIGHT])
+    # (9, H, W, 3) -> (H, W, 9, 3) is the channel concatenation, fused into the scale pass
+    src = scratch_u8.reshape(seq_frames, HEIGHT, WIDTH, 3).transpose(1, 2, 0, 3)
+    dst = out.reshape(HEIGHT, WIDTH, seq_frames, 3)
+    np.divide(src, np.float32(255.0), out=dst, dtype=np.float32)
 
 def run_inference_on_video(input_video_path, output_dir):
     """
@@ -77,21 +182,29 @@ def run_inference_on_video(input_video_path, output_dir):
 
     # --- 2. Initialize TFLite Interpreter ---
     try:
-        interpreter = Interpreter(model_path=TFLITE_MODEL_PATH)
+        interpreter = Interpreter(model_path=TFLITE_MODEL_PATH, num_threads=TFLITE_NUM_THREADS)
+        # Size the input for a full batch once; the tail batch is padded to
+        # this shape, so allocate_tensors() never runs inside the loop
+        input_index = interpreter.get_input_details()[0]['index']
+        interpreter.resize_tensor_input(input_index, (BATCH_SIZE, HEIGHT, WIDTH, IN_CHANNELS))
         interpreter.allocate_tensors()
-        input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
-        print(f"--- TFLite model loaded: {TFLITE_MODEL_PATH} ---")
+        # Raw views into the interpreter's arena: the batch is preprocessed
+        # straight into the input tensor and the heatmaps are read in place,
+        # skipping the set_tensor/get_tensor copies
+        input_tensor = interpreter.tensor(input_index)
+        output_tensor = interpreter.tensor(output_details[0]['index'])
+        logger.info("--- TFLite model loaded: %s ---", TFLITE_MODEL_PATH)
     except Exception as e:
         error_msg = f"Error loading TFLite model: {e}. Make sure '{TFLITE_MODEL_PATH}' is in the root directory."
-        print(f"❌ {error_msg}")
+        logger.exception("❌ %s", error_msg)
         return False, error_msg, None # <-- MODIFIED
 
     # --- 3. Initialize Video Capture and Writer ---
     cap = cv2.VideoCapture(input_video_path)
     if not cap.isOpened():
         error_msg = f"Error: Could not open video file {input_video_path}"
-        print(f"❌ {error_msg}")
+        logger.error("❌ %s", error_msg)
         return False, error_msg, None # <-- MODIFIED
     
     # Set buffer size to reduce I/O overhead
@@ -104,11 +217,13 @@ def run_inference_on_video(input_video_path, output_dir):
     ratio = original_h / HEIGHT
     image_num_frame = SEQ_LEN + 1 # This is 9
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (original_w, original_h))
-    if not out.isOpened():
-        error_msg = f"Error: Could not create output video writer at {output_video_path}"
-        print(f"❌ {error_msg}")
+    # Annotated frames are piped raw into ffmpeg, which encodes browser-playable
+    # H.264 in one pass (mp4v from cv2.VideoWriter would need a re-encode)
+    try:
+        out = open_h264_pipe(output_video_path, original_w, original_h, fps)
+    except OSError as e:
+        error_msg = f"Error: Could not create output video writer at {output_video_path}: {e}"
+        logger.exception("❌ %s", error_msg)
         cap.release()
         return False, error_msg, None # <-- MODIFIED
 
@@ -118,140 +233,131 @@ def run_inference_on_video(input_video_path, output_dir):
             f_csv.write('Frame,Visibility,X,Y\n')
     except Exception as e:
         error_msg = f"Error: Could not write to CSV file {output_csv_path}: {e}"
-        print(f"❌ {error_msg}")
+        logger.exception("❌ %s", error_msg)
         cap.release()
-        out.release()
+        out.kill()
         return False, error_msg, None # <-- MODIFIED
 
-    # --- 5. Main Processing Loop (with parallel processing) ---
-    print(f"--- Starting inference on {input_video_path} ---")
+    # --- 5. Main Processing Loop (decode -> infer -> encode pipeline) ---
+    # Decoding and encoding run on their own threads; the interpreter stays on
+    # this thread since TFLite is not thread-safe.
+    logger.info("--- Starting inference on %s ---", input_video_path)
     frame_count = 0
     pbar = tqdm(total=total_frames, desc=f"Inferring {base_filename}")
     
-    # Determine number of worker threads (use CPU count, but cap at 6 for better parallelism)
-    import multiprocessing
-    num_workers = min(6, multiprocessing.cpu_count())
-    
+    seq_rows = image_num_frame * original_h
+    resize_scratch = np.empty((image_num_frame * HEIGHT, WIDTH, 3), dtype=np.uint8)
+    heatmap_mask = np.empty((BATCH_SIZE, HEIGHT, WIDTH, SEQ_LEN), dtype=np.bool_) # Reused ">0.5" mask
+    # A fixed pool of sequence buffers cycles reader -> inference -> writer ->
+    # reader. While invoke() holds one batch, the other batch's buffers are
+    # encoded and handed straight back to be decoded into, so the next batch
+    # is ready when invoke() returns. Frames in flight never exceed
+    # SEQUENCE_POOL_SIZE sequences
+    free_q = queue.Queue()
+    for _ in range(SEQUENCE_POOL_SIZE):
+        free_q.put(np.empty((seq_rows, original_w, 3), dtype=np.uint8))
+    frame_q, stop_reading, read_errors, reader = _start_sequence_reader(cap, original_h, free_q)
+    write_q, write_errors, writer = _start_result_writer(out, output_csv_path, free_q)
     video_ended = False
     try:
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            while True:
-                frame_queue = []
-                if not video_ended:
-                    for _ in range(image_num_frame * BATCH_SIZE):
-                        success, frame = cap.read()
-                        if not success:
-                            video_ended = True
-                            break
-                        frame_queue.append(frame)
-                
-                if not frame_queue:
-                    break 
-
-                num_full_sequences = len(frame_queue) // image_num_frame
-                if num_full_sequences == 0:
-                    pbar.update(len(frame_queue))
-                    break 
-
-                frames_to_process_count = num_full_sequences * image_num_frame
-                process_queue = frame_queue[:frames_to_process_count]
-                frames_discarded_at_end = len(frame_queue) - frames_to_process_count
-
-                # Parallel preprocessing: resize and concatenate sequences
-                sequences = [process_queue[i:i+image_num_frame] 
-                           for i in range(0, len(process_queue), image_num_frame)]
-                preprocess_func = partial(_preprocess_sequence, width=WIDTH, height=HEIGHT)
-                batch_input_list = list(executor.map(preprocess_func, sequences))
+        while not video_ended:
+            if write_errors:
+                break # Encoding failed: stop decoding, reported after cleanup
+            sequences = []
+            frames_discarded_at_end = 0
+            while len(sequences) < BATCH_SIZE:
+                seq = frame_q.get()
+                if seq is None:
+                    video_ended = True
+                    if read_errors:
+                        raise RuntimeError(f"Frame reader failed: {read_errors[0]}") from read_errors[0]
+                    break
+                if len(seq) < seq_rows:
+                    # Partial final sequence: too short to infer on
+                    frames_discarded_at_end = len(seq) // original_h
+                    continue
+                sequences.append(seq)
 
-                if not batch_input_list:
-                    if video_ended:
-                        pbar.update(len(frame_queue))
-                    break 
+            num_full_sequences = len(sequences)
+            if num_full_sequences == 0:
+                pbar.update(frames_discarded_at_end)
+                break 
 
-                batch_input = np.array(batch_input_list, dtype=np.float32) / 255.0
+            # Each sequence is resized straight into its slot of the input
+            # tensor; OpenCV parallelizes the resize internally
+            batch_buffer = input_tensor()
+            for seq, slot in zip(sequences, batch_buffer):
+                _preprocess_sequence(seq, slot, resize_scratch)
+            if num_full_sequences < BATCH_SIZE:
+                batch_buffer[num_full_sequences:] = 0 # Padding; its predictions are ignored
+            del batch_buffer, slot # invoke() refuses to run while arena views are alive
 
-                # Model inference (keep sequential - TFLite may not be thread-safe)
-                # Only resize/allocate if batch size changed (optimization)
-                current_shape = interpreter.get_input_details()[0]['shape']
-                if list(current_shape) != list(batch_input.shape):
-                    interpreter.resize_tensor_input(input_details[0]['index'], batch_input.shape)
-                    interpreter.allocate_tensors()
-                interpreter.set_tensor(input_details[0]['index'], batch_input)
-                interpreter.invoke()
-                y_pred = interpreter.get_tensor(output_details[0]['index'])
-                h_pred = np.transpose(y_pred, (0, 3, 1, 2)).reshape(-1, HEIGHT, WIDTH)
-                
-                # Prepare post-processing tasks (parallel) - only for frames with predictions
-                postprocess_tasks = []
-                frame_order = []  # Track order: (frame_idx, is_last_frame, queue_idx)
-                
-                for b in range(num_full_sequences):
-                    # Process frames 0-7 (with predictions)
-                    for f in range(SEQ_LEN):
-                        pred_idx = b * SEQ_LEN + f
-                        frame_idx_in_queue = b * image_num_frame + f
-                        frame_idx_global = frame_count + frame_idx_in_queue
-                        postprocess_tasks.append((
-                            process_queue[frame_idx_in_queue],
-                            h_pred[pred_idx],
-                            frame_idx_global,
-                            ratio
-                        ))
-                        frame_order.append((frame_idx_global, False, frame_idx_in_queue))
-                    
-                    # Track last frame (9th frame) - no prediction
-                    last_frame_idx_in_queue = b * image_num_frame + SEQ_LEN
-                    last_frame_idx_global = frame_count + last_frame_idx_in_queue
-                    frame_order.append((last_frame_idx_global, True, last_frame_idx_in_queue))
-                
-                # Parallel post-processing (only for frames with predictions)
-                results = list(executor.map(_postprocess_frame, postprocess_tasks))
-                
-                # Write results sequentially (maintain order for video/CSV)
-                result_idx = 0
-                csv_lines = []
-                
-                for frame_idx_global, is_last_frame, queue_idx in frame_order:
-                    if is_last_frame:
-                        # Last frame - no prediction
-                        img = process_queue[queue_idx].copy()
-                        csv_lines.append(f'{frame_idx_global},0,0,0\n')
-                        out.write(img)
+            # Model inference (keep sequential - TFLite may not be thread-safe)
+            interpreter.invoke()
+            y_pred = output_tensor()[:num_full_sequences]
+            
+            # Centers for the whole batch in one vectorized pass, read in the
+            # output's own (B, H, W, SEQ_LEN) layout with no transposed copy;
+            # the threshold goes into the preallocated mask, not a new array
+            mask = heatmap_mask[:num_full_sequences]
+            np.greater(y_pred[..., :SEQ_LEN], 0.5, out=mask)
+            del y_pred
+            cx_all, cy_all = centers_batch(mask)
+            vis_all = ((cx_all > 0) | (cy_all > 0)).tolist()
+            x_all = (ratio * cx_all).astype(int).tolist() # Back to original resolution
+            y_all = (ratio * cy_all).astype(int).tolist()
+            
+            # One pass in frame order: circles are drawn onto the sequence buffers
+            # in place, so the batch goes to the writer as-is with its CSV lines
+            # joined into one string. The 9th frame of each sequence has no prediction.
+            csv_buf = []
+            for b in range(num_full_sequences):
+                seq = sequences[b]
+                for f in range(image_num_frame):
+                    frame_idx = frame_count + b * image_num_frame + f
+                    if f < SEQ_LEN and vis_all[b][f]:
+                        x, y = x_all[b][f], y_all[b][f]
+                        # Every sequence is decoded into its own buffer and
+                        # preprocessing has already resized it, so draw in place
+                        cv2.circle(seq[f*original_h:(f+1)*original_h], (x, y), 5, (0, 0, 255), -1)
+                        csv_buf.append(f'{frame_idx},1,{x},{y}\n')
                     else:
-                        # Frame with prediction
-                        img, csv_line = results[result_idx]
-                        csv_lines.append(csv_line)
-                        out.write(img)
-                        result_idx += 1
-                
-                # Write CSV lines in batch (faster than individual writes)
-                if csv_lines:
-                    with open(output_csv_path, 'a') as f_csv:
-                        f_csv.writelines(csv_lines)
+                        csv_buf.append(f'{frame_idx},0,0,0\n')
+            write_q.put((sequences, ''.join(csv_buf)))
 
-                frame_count += len(process_queue)
-                pbar.update(len(process_queue))
-                if video_ended and frames_discarded_at_end > 0:
-                    pbar.update(frames_discarded_at_end)
-                if video_ended:
-                    break
+            frames_processed = num_full_sequences * image_num_frame
+            frame_count += frames_processed
+            pbar.update(frames_processed + frames_discarded_at_end)
     
     except Exception as e:
         error_msg = f"Error during inference loop: {e}"
-        print(f"❌ {error_msg}")
+        logger.exception("❌ %s", error_msg)
         pbar.close()
+        if not video_ended:
+            _stop_frame_reader(frame_q, stop_reading, reader)
+        write_q.put(None)
+        writer.join()
         cap.release()
-        out.release()
+        out.kill()
         return False, error_msg, None # <-- MODIFIED
 
     # --- 6. Cleanup ---
     pbar.close()
+    if not video_ended:
+        _stop_frame_reader(frame_q, stop_reading, reader)
+    reader.join()
+    write_q.put(None)
+    writer.join()
     cap.release()
-    out.release()
-    print(f"\n--- TFLite Inference Complete ---")
-    print(f"Total frames processed: {frame_count}")
-    print(f"✅ Output video saved to: {output_video_path}")
-    print(f"✅ Output CSV saved to: {output_csv_path}")
+    if write_errors:
+        out.kill()
+        return False, f"Error writing inference output: {write_errors[0]}", None
+    if not close_h264_pipe(out, output_video_path):
+        return False, f"Error: Could not encode output video {output_video_path}", None
+    logger.info("--- TFLite Inference Complete ---")
+    logger.info("Total frames processed: %s", frame_count)
+    logger.info("✅ Output video saved to: %s", output_video_path)
+    logger.info("✅ Output CSV saved to: %s", output_csv_path)
     
     # Return the *full filesystem paths*
     return True, output_video_path, output_csv_path # <-- MODIFIED
\ No newline at end of file
@@ -1,8 +1,11 @@
+import logging
 import os
 import time
 import datetime
 import subprocess
 
+logger = logging.getLogger(__name__)
+
 # Matches the framerate in camera_controller.py
 FRAMERATE = 47.57 
 
@@ -21,7 +24,7 @@ def create_instant_replay(output_dir, video_extension=".mp4", duration=30):
     """
     try:
         recordings_dir = "static/recordings"
-        temp_tail_path = os.path.join(output_dir, "temp_replay_tail.h264")
+        tail_data = None # Raw .h264 tail, piped to ffmpeg's stdin
         
         # 1. Find the latest active .h264 file
         files = [os.path.join(recordings_dir, f) for f in os.listdir(recordings_dir) if f.endswith(".h264")]
@@ -41,7 +44,7 @@ def create_instant_replay(output_dir, video_extension=".mp4", duration=30):
         replay_path = os.path.join(output_dir, replay_filename)
         os.makedirs(output_dir, exist_ok=True)
 
-        print(f"--- Processing replay from source: {latest_file} ---")
+        logger.info("--- Processing replay from source: %s ---", latest_file)
 
         # 3. Handle Raw .h264 (Active Recording)
         if latest_file.endswith(".h264"):
@@ -55,18 +58,16 @@ def create_instant_replay(output_dir, video_extension=".mp4", duration=30):
                     f.seek(0)
                 tail_data = f.read()
             
-            # Write to a temp file
-            with open(temp_tail_path, "wb") as temp:
-                temp.write(tail_data)
-            
             # Convert the tail chunk to MP4
             # We removed '-sseof' because we already sliced the file in Python.
-            # We just wrap whatever we grabbed.
+            # We just wrap whatever we grabbed. The chunk goes through stdin,
+            # so no temp copy is written to (and re-read from) the SD card.
             command = [
                 'ffmpeg',
                 '-y',
                 '-r', str(FRAMERATE),      # Force input framerate
-                '-i', temp_tail_path,      # Input the ~30s chunk
+                '-f', 'h264',              # A pipe has no extension to probe
+                '-i', 'pipe:0',            # Input the ~30s chunk
                 '-c:v', 'copy',            # Copy stream (fast)
                 replay_path
             ]
@@ -84,19 +85,16 @@ def create_instant_replay(output_dir, video_extension=".mp4", duration=30):
             ]
 
         # Execute
-        result = subprocess.run(command, capture_output=True, text=True)
-        
-        # Cleanup temp file
-        if os.path.exists(temp_tail_path):
-            os.remove(temp_tail_path)
+        result = subprocess.run(command, input=tail_data, capture_output=True)
+        stderr = result.stderr.decode(errors='replace')
 
         if result.returncode == 0:
-            print(f"✅ Replay saved: {replay_path}")
+            logger.info("✅ Replay saved: %s", replay_path)
             return True, "Replay created.", replay_path
         else:
-            print(f"❌ Replay failed: {result.stderr}")
-            return False, f"FFmpeg error: {result.stderr[-200:]}", None
+            logger.error("❌ Replay failed: %s", stderr)
+            return False, f"FFmpeg error: {stderr[-200:]}", None
 
     except Exception as e:
-        print(f"❌ Error creating replay: {e}")
+        logger.exception("❌ Error creating replay: %s", e)
         return False, str(e), None
\ No newline at end of file
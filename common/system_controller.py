@@ -1,23 +1,26 @@
-import os
+import logging
+import subprocess
 import sys
 
+logger = logging.getLogger(__name__)
+
 # The name of your systemd service file
 SERVICE_NAME = "camera_app.service"
 
 def restart_app():
     """Restarts the application by restarting the systemd service."""
-    print(f"--- Restarting Application via systemctl restart {SERVICE_NAME} ---")
+    logger.info("--- Restarting Application via systemctl restart %s ---", SERVICE_NAME)
     try:
-        # Use sudo to run the systemctl command
-        os.system(f"sudo systemctl restart {SERVICE_NAME}")
+        # Use sudo to run the systemctl command (exec'd directly, no shell)
+        subprocess.Popen(['sudo', 'systemctl', 'restart', SERVICE_NAME], close_fds=True).wait()
     except Exception as e:
-        print(f"ERROR: Failed to restart application service: {e}")
+        logger.exception("Failed to restart application service: %s", e)
 
 
 def restart_system():
     """Reboots the Raspberry Pi."""
-    print("--- Restarting System ---")
+    logger.info("--- Restarting System ---")
     try:
-        os.system("sudo reboot")
+        subprocess.Popen(['sudo', 'reboot'], close_fds=True)
     except Exception as e:
-        print(f"ERROR: Failed to restart system: {e}")
\ No newline at end of file
+        logger.exception("Failed to restart system: %s", e)
\ No newline at end of file
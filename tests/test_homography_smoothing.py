@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+try:
+    from common import homography_controller
+except ImportError: # torch / ultralytics not installed
+    homography_controller = None
+
+
+@unittest.skipIf(homography_controller is None, "homography_controller dependencies not installed")
+class CenteredRollingMeanTest(unittest.TestCase):
+    """_centered_rolling_mean must match the pandas centered rolling mean it replaced."""
+
+    WINDOW = 7
+    CASES = {
+        "with_nans": [1.0, np.nan, 3.0, 4.0, np.nan, np.nan, 7.0, 8.0, 9.0, np.nan, 11.0, 12.0],
+        "nan_gap_wider_than_window": [1.0, 2.0] + [np.nan] * 9 + [5.0, 6.0],
+        "shorter_than_window": [2.0, np.nan, 5.0, 1.0],
+        "single_value": [3.0],
+        "all_nan": [np.nan] * 5,
+    }
+
+    def _expected(self, values):
+        return pd.Series(values).rolling(self.WINDOW, center=True, min_periods=1).mean().to_numpy()
+
+    def _check_all_cases(self):
+        for name, values in self.CASES.items():
+            with self.subTest(case=name):
+                got = homography_controller._centered_rolling_mean(values, window=self.WINDOW)
+                np.testing.assert_allclose(got, self._expected(values), equal_nan=True)
+
+    @unittest.skipIf(homography_controller is not None and homography_controller.bn is None,
+                     "bottleneck not installed")
+    def test_bottleneck_path(self):
+        self._check_all_cases()
+
+    def test_numpy_fallback_path(self):
+        with mock.patch.object(homography_controller, "bn", None):
+            self._check_all_cases()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,29 @@
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # The primary and fallback paths for the machine-id file
 MACHINE_ID_PATH = "/etc/machine-id"
 MACHINE_ID_FALLBACK_PATH = "/var/lib/dbus/machine-id"
 
+_device_uuid = None # machine-id never changes, so it is read once
+
 def get_device_uuid():
     """
     Retrieves a unique and stable device ID from the system's machine-id file.
+    The value is cached after the first successful read.
     """
+    global _device_uuid
+    if _device_uuid is None:
+        device_uuid = _read_device_uuid()
+        if device_uuid == "unknown_uuid_error":
+            return device_uuid # Don't cache a transient failure
+        _device_uuid = device_uuid
+    return _device_uuid
+
+def _read_device_uuid():
+    """Reads the device ID from the machine-id file."""
     try:
         path_to_read = ""
         if os.path.exists(MACHINE_ID_PATH):
@@ -22,7 +38,7 @@ def get_device_uuid():
             # .strip() removes any newline characters.
             return f.read().strip()
     except Exception as e:
-        print(f"ERROR: Could not read device UUID: {e}")
+        logger.exception("Could not read device UUID: %s", e)
         return "unknown_uuid_error"
 
 def get_device_name():
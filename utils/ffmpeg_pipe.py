@@ -0,0 +1,74 @@
+import logging
+import os
+import subprocess
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Pi hardware H.264 encoder; libx264 is used when it is not available
+HW_H264_ENCODER = 'h264_v4l2m2m'
+PIPE_BUFFER_SIZE = 4 * 1024 * 1024 # Large stdin buffer = fewer write() syscalls
+FRAGMENTED_MP4_FLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+
+PROBE_TIMEOUT = 10 # Seconds allowed for the one-frame encoder probe
+
+@lru_cache(maxsize=None)
+def h264_encoder_args():
+    """Returns the ffmpeg encoder arguments, preferring the Pi hardware encoder."""
+    if _encoder_works(HW_H264_ENCODER):
+        logger.info("Using hardware H.264 encoder %s", HW_H264_ENCODER)
+        return ['-c:v', HW_H264_ENCODER, '-b:v', '4M']
+    logger.info("Hardware H.264 encoder unavailable, using libx264")
+    return ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'fastdecode',
+            '-bf', '0', '-g', '30', '-threads', str(os.cpu_count() or 1)]
+
+def _encoder_works(encoder):
+    """
+    Encodes one test frame with encoder. Being listed in `ffmpeg -encoders`
+    only means it was compiled in; this also proves the device is present
+    and accepts yuv420p input.
+    """
+    command = [
+        'ffmpeg', '-hide_banner',
+        '-f', 'lavfi', '-i', 'color=s=640x360',
+        '-frames:v', '1',
+        '-pix_fmt', 'yuv420p',
+        '-c:v', encoder,
+        '-f', 'null', '-'
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+def open_h264_pipe(out_path, width, height, fps):
+    """Starts an ffmpeg process that encodes raw BGR frames from stdin to a web-ready H.264 MP4."""
+    command = [
+        'ffmpeg',
+        '-y',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'bgr24',
+        '-s', f'{width}x{height}',
+        '-r', str(fps),
+        '-i', '-',            # Frames arrive on stdin
+        *h264_encoder_args(),
+        '-pix_fmt', 'yuv420p',
+        '-movflags', FRAGMENTED_MP4_FLAGS,
+        '-frag_duration', '1000000',
+        out_path
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, bufsize=PIPE_BUFFER_SIZE)
+
+def close_h264_pipe(proc, out_path):
+    """Flushes the frame pipe and waits for ffmpeg. Returns True if the file was written."""
+    try:
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    if proc.wait() != 0:
+        logger.error("Error encoding video %s: ffmpeg exited with %s", out_path, proc.returncode)
+        return False
+    return True
@@ -1,19 +1,37 @@
+import logging
+import os
+import threading
 import psutil
 from .device_info import get_device_uuid # Import the function
 
+logger = logging.getLogger(__name__)
+
 # Path to the file containing the CPU temperature
 TEMP_FILE_PATH = "/sys/class/thermal/thermal_zone0/temp"
 
+# Prime the CPU counters: later interval=None calls then report usage since the
+# previous call instead of blocking for a 1 second sample
+psutil.cpu_percent(interval=None)
+
+_temp_fd = None # Kept open across calls; sysfs re-reads from offset 0 give a fresh value
+_temp_fd_lock = threading.Lock() # Request threads must not read a descriptor another one is closing
+
 def get_cpu_temperature():
     """Reads the CPU temperature from the system file and returns it in Celsius."""
-    try:
-        with open(TEMP_FILE_PATH, 'r') as f:
+    global _temp_fd
+    with _temp_fd_lock:
+        try:
+            if _temp_fd is None:
+                _temp_fd = os.open(TEMP_FILE_PATH, os.O_RDONLY)
             # The value is in millidegrees Celsius, so divide by 1000
-            temperature_milli_c = int(f.read().strip())
+            temperature_milli_c = int(os.pread(_temp_fd, 16, 0))
             return round(temperature_milli_c / 1000.0, 1)
-    except (IOError, ValueError) as e:
-        print(f"WARN: Could not read CPU temperature: {e}")
-        return None # Return None if reading fails
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read CPU temperature: %s", e)
+            if _temp_fd is not None:
+                os.close(_temp_fd)
+                _temp_fd = None # Reopen on the next call
+            return None # Return None if reading fails
 
 
 def get_health_report():
@@ -23,14 +41,14 @@ def get_health_report():
     try:
         health = {
             "device_id": get_device_uuid(), # Add device_id here
-            "cpu_usage_percent": psutil.cpu_percent(interval=1),
+            "cpu_usage_percent": psutil.cpu_percent(interval=None), # Non-blocking
             "memory_usage_percent": psutil.virtual_memory().percent,
             "disk_usage_percent": psutil.disk_usage("/").percent,
             "cpu_temperature_c": get_cpu_temperature(), # Add CPU temperature
         }
         return health
     except Exception as e:
-        print(f"ERROR: Could not retrieve health report: {e}")
+        logger.exception("Could not retrieve health report: %s", e)
         return {
             "error": "Could not retrieve health information.",
             "details": str(e),